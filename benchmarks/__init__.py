@@ -0,0 +1,241 @@
+"""Benchmarks of Arnold tasks, run against local stand-ins for all services.
+
+Crowdin, GitHub, and the websites linked to are replaced by local HTTP
+servers, and repositories by synthetic repositories with local remotes,
+so benchmarks need no network access or credentials. Docker, Docker
+Compose, and sudo are replaced by the scripts in benchmarks/bin/.
+
+Each case is run cold and then warm, measuring wall time, requests to
+each service, subprocesses started, and peak memory use. Results are
+written to a JSON file and compared with the previous results.
+
+Run with:
+
+    python3 -m benchmarks
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import platform
+import subprocess
+import multiprocessing
+from .fake_servers import FakeCrowdin, FakeGitHub, FakeWebsite
+from .repositories import create_repository, get_project_config, get_source_files, BRANCH
+from .cases import run_case, CASES, GITHUB_OWNER, GITHUB_BOT_USERNAME
+
+DEFAULT_OUTPUT_DIRECTORY = os.path.join("cache", "benchmarks")
+RESULTS_FILENAME = "benchmark-{}.json"
+DEFAULT_FILES = 200
+DEFAULT_LANGUAGES = 8
+DEFAULT_URLS = 500
+DEFAULT_WEBSITES = 4
+DEFAULT_LATENCY = 0.02
+RUNS = ["cold", "warm"]
+# Measurements compared between results, with the format to display them in
+COMPARED_MEASUREMENTS = [
+    ("wall_seconds", "{:.2f}s"),
+    ("requests", "{:d}"),
+    ("subprocesses", "{:d}"),
+    ("peak_rss_bytes", "{:.0f}MB"),
+]
+MEGABYTE = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks", description="Benchmark Arnold tasks.")
+    parser.add_argument(
+        "cases",
+        help="Cases to run, from {} (default: all cases)".format(", ".join(CASES)),
+        nargs="*",
+    )
+    parser.add_argument("--files", help="Number of source files", type=int, default=DEFAULT_FILES)
+    parser.add_argument("--languages", help="Number of Crowdin languages", type=int, default=DEFAULT_LANGUAGES)
+    parser.add_argument("--urls", help="Number of unique URLs linked to", type=int, default=DEFAULT_URLS)
+    parser.add_argument("--websites", help="Number of websites linked to", type=int, default=DEFAULT_WEBSITES)
+    parser.add_argument(
+        "--latency",
+        help="Seconds added to each response from a fake server (default: {})".format(DEFAULT_LATENCY),
+        type=float,
+        default=DEFAULT_LATENCY,
+    )
+    parser.add_argument(
+        "--output-directory",
+        help="Directory to write results to (default: {})".format(DEFAULT_OUTPUT_DIRECTORY),
+        default=DEFAULT_OUTPUT_DIRECTORY,
+    )
+    parser.add_argument(
+        "--compare",
+        help="Results file to compare with (default: latest results in the output directory)",
+    )
+    parser.add_argument("-v", "--verbose", help="Log output of tasks", action="store_true")
+    args = parser.parse_args()
+    unknown_cases = set(args.cases) - set(CASES)
+    if unknown_cases:
+        parser.error("unknown cases: {}".format(", ".join(sorted(unknown_cases))))
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    previous_results_path = args.compare or get_latest_results_path(args.output_directory)
+    parameters = {
+        "files": args.files,
+        "languages": args.languages,
+        "urls": args.urls,
+        "websites": args.websites,
+        "latency": args.latency,
+    }
+    results = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "parameters": parameters,
+        "cases": dict(),
+    }
+    for case_name in args.cases or CASES:
+        logging.info("Running '{}' benchmark...".format(case_name))
+        results["cases"][case_name] = run_benchmark(case_name, parameters, args.verbose)
+    results_path = save_results(args.output_directory, results)
+    logging.info("Results written to {}".format(results_path))
+    if previous_results_path:
+        with open(previous_results_path, "r") as f:
+            previous_results = json.load(f)
+        if previous_results["parameters"] != parameters:
+            logging.warning("Previous results used different parameters: {}".format(previous_results["parameters"]))
+        logging.info("Compared with {} (commit {})".format(previous_results_path, previous_results["commit"]))
+    else:
+        previous_results = None
+    logging.info(format_results(results, previous_results))
+
+
+def run_benchmark(case_name, parameters, verbose):
+    """Set up a case and run it cold and then warm.
+
+    Returns:
+        Dictionary mapping each run to its measurements.
+    """
+    languages = ["l{}".format(number) for number in range(parameters["languages"])]
+    services = {
+        "crowdin": FakeCrowdin(languages, latency=parameters["latency"]),
+        "github": FakeGitHub(GITHUB_OWNER, GITHUB_BOT_USERNAME, latency=parameters["latency"]),
+        "websites": [FakeWebsite(latency=parameters["latency"]) for number in range(parameters["websites"])],
+    }
+    for service in get_all_services(services):
+        service.start()
+    workspace = tempfile.mkdtemp(prefix="arnold-benchmark-")
+    try:
+        name = "benchmark-repository"
+        (directory, head) = create_repository(
+            workspace,
+            name,
+            parameters["files"],
+            parameters["urls"],
+            [website.url for website in services["websites"]],
+        )
+        services["github"].add_repository(name, head)
+        if case_name == "pull-translations":
+            services["crowdin"].add_files(get_source_files(parameters["files"]))
+        context = {
+            "name": name,
+            "directory": directory,
+            "branch": BRANCH,
+            "cache_directory": os.path.join(workspace, "cache"),
+            "config": get_project_config(),
+            "crowdin_url": services["crowdin"].url,
+            "github_url": services["github"].url,
+        }
+        case_results = dict()
+        for run in RUNS:
+            for service in get_all_services(services):
+                service.reset_counts()
+            measurements = run_in_new_process(case_name, context, verbose)
+            measurements["request_counts"] = {
+                "crowdin": services["crowdin"].request_counts,
+                "github": services["github"].request_counts,
+                "websites": merge_counts([website.request_counts for website in services["websites"]]),
+            }
+            measurements["requests"] = sum(
+                sum(counts.values()) for counts in measurements["request_counts"].values()
+            )
+            case_results[run] = measurements
+            logging.info("  {}: {}".format(run, format_measurements(measurements)))
+        return case_results
+    finally:
+        for service in get_all_services(services):
+            service.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def get_all_services(services):
+    return [services["crowdin"], services["github"]] + services["websites"]
+
+
+def run_in_new_process(case_name, context, verbose):
+    # Spawn a fresh process so peak memory use only covers this run
+    spawn_context = multiprocessing.get_context("spawn")
+    with spawn_context.Pool(processes=1) as pool:
+        return pool.apply(run_case, (case_name, context, verbose))
+
+
+def merge_counts(request_counts):
+    merged = dict()
+    for counts in request_counts:
+        for (endpoint, count) in counts.items():
+            merged[endpoint] = merged.get(endpoint, 0) + count
+    return merged
+
+
+def get_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return result.stdout.decode("utf-8").strip() or None
+
+
+def save_results(directory, results):
+    os.makedirs(directory, exist_ok=True)
+    results_path = os.path.join(directory, RESULTS_FILENAME.format(time.strftime("%Y%m%d-%H%M%S")))
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    return results_path
+
+
+def get_latest_results_path(directory):
+    if not os.path.isdir(directory):
+        return None
+    filenames = sorted(filename for filename in os.listdir(directory) if filename.startswith("benchmark-"))
+    return os.path.join(directory, filenames[-1]) if filenames else None
+
+
+def format_value(key, value, value_format):
+    if key == "peak_rss_bytes":
+        value = value / MEGABYTE
+    return value_format.format(value)
+
+
+def format_measurements(measurements):
+    return ", ".join(
+        "{} {}".format(key, format_value(key, measurements[key], value_format))
+        for (key, value_format) in COMPARED_MEASUREMENTS
+    )
+
+
+def format_results(results, previous_results=None):
+    """Format results as a table, with the change from previous results."""
+    lines = ["", "{:<30} {:<6} {}".format("Case", "Run", "  ".join(
+        "{:>20}".format(key) for (key, value_format) in COMPARED_MEASUREMENTS
+    ))]
+    for (case_name, case_results) in results["cases"].items():
+        for (run, measurements) in case_results.items():
+            cells = []
+            for (key, value_format) in COMPARED_MEASUREMENTS:
+                cell = format_value(key, measurements[key], value_format)
+                try:
+                    previous_value = previous_results["cases"][case_name][run][key]
+                except (TypeError, KeyError):
+                    previous_value = None
+                if previous_value:
+                    cell += " ({:+.0f}%)".format((measurements[key] - previous_value) / previous_value * 100)
+                cells.append("{:>20}".format(cell))
+            lines.append("{:<30} {:<6} {}".format(case_name, run, "  ".join(cells)))
+    return "\n".join(lines)
@@ -0,0 +1,162 @@
+"""Benchmark cases, each running one Arnold task on a synthetic repository.
+
+Every run of a case is measured in a fresh process, so its peak memory
+use is not affected by other runs. State kept on disk (such as the
+repository, remote, and caches) and by the fake servers is kept between
+the runs of a case, so the first run is measured cold and later runs
+are measured warm.
+"""
+
+import os
+import sys
+import types
+import logging
+import resource
+import threading
+import subprocess
+from timeit import default_timer as timer
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SHIMS_DIRECTORY = os.path.join(BENCHMARKS_DIRECTORY, "bin")
+GITHUB_OWNER = "uccser"
+GITHUB_BOT_USERNAME = "uccser-bot"
+DOCKER_CACHE_SIZE = 8
+
+
+def get_task_function(case_name):
+    """Import and return the task function measured by a case."""
+    if case_name == "push-source-files":
+        from translation import push_source_files
+        return push_source_files
+    elif case_name == "pull-translations":
+        from translation import pull_translations
+        return pull_translations
+    elif case_name == "update-source-message-files":
+        from translation import update_source_message_file
+        return update_source_message_file
+    elif case_name == "link-checker":
+        from link_checker import check_links
+        return check_links
+    raise ValueError("Unknown benchmark case: {}".format(case_name))
+
+
+CASES = [
+    "push-source-files",
+    "pull-translations",
+    "update-source-message-files",
+    "link-checker",
+]
+
+
+class SubprocessCounter:
+    """Counts every subprocess started, by replacing subprocess.Popen."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def install(self):
+        counter = self
+
+        class CountingPopen(subprocess.Popen):
+            def __init__(self, *args, **kwargs):
+                with counter.lock:
+                    counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+
+
+def run_case(case_name, context, verbose):
+    """Run the task of a case once, in the current process.
+
+    Args:
+        case_name: (str) Name of the case.
+        context: (dict) Paths, config, and server URLs set up for the case.
+        verbose: (bool) True to log the task's output.
+
+    Returns:
+        Dictionary of measurements.
+    """
+    os.environ["PATH"] = SHIMS_DIRECTORY + os.pathsep + os.environ["PATH"]
+    sys.path.insert(0, os.path.dirname(BENCHMARKS_DIRECTORY))
+
+    import github
+    import utils.github_api
+    import translation.crowdin_api
+    from utils import reset_working_copy
+    from utils.git import GitRepository
+    from utils.run_journal import RunJournal
+    from translation import create_crowdin_client
+    task_function = get_task_function(case_name)
+    # Set after imports, as Linkie configures logging when imported
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO if verbose else logging.WARNING)
+
+    translation.crowdin_api.API_URL = context["crowdin_url"] + "/api/project/{project}/{method}"
+    utils.github_api.GRAPHQL_URL = context["github_url"] + "/graphql"
+    counter = SubprocessCounter()
+    counter.install()
+
+    # Prepare the project as run.py does before running a task
+    name = context["name"]
+    reset_working_copy(context["directory"], context["branch"])
+    github_client = utils.github_api.GitHubClient("token")
+    github_index = utils.github_api.load_repository_index(
+        github_client,
+        GITHUB_OWNER,
+        GITHUB_BOT_USERNAME,
+        repository_name=name,
+    )
+    github_env = github.Github("token", base_url=context["github_url"])
+    project = types.SimpleNamespace(
+        name=name,
+        config=context["config"],
+        repo=github_env.get_repo("{}/{}".format(GITHUB_OWNER, name)),
+        bot=None,
+        secrets=dict(),
+        directory=context["directory"],
+        parent_directory=os.path.dirname(context["directory"]),
+        cache_directory=os.path.join(context["cache_directory"], "projects", name),
+        shared_cache_directory=context["cache_directory"],
+        cli_args=types.SimpleNamespace(task=case_name, docker_cache_size=DOCKER_CACHE_SIZE, languages=None),
+        github_data=github_index[name],
+        crowdin_api_key="key",
+        git=GitRepository(context["directory"]),
+        journal=RunJournal(context["cache_directory"]),
+    )
+    project.crowdin = create_crowdin_client(project)
+    project.head_commit = project.git.run(["rev-parse", "HEAD"]).stdout.decode("utf-8").strip()
+    subprocesses_before = counter.count
+
+    start_time = timer()
+    try:
+        task_function(project)
+    finally:
+        wall_seconds = timer() - start_time
+        project.crowdin.close()
+        project.git.close()
+        github_client.close()
+    return {
+        "wall_seconds": wall_seconds,
+        "subprocesses": counter.count - subprocesses_before,
+        "peak_rss_bytes": get_peak_rss_bytes(),
+    }
+
+
+def get_peak_rss_bytes():
+    """Return the peak resident set size of this process.
+
+    On Linux this is read from /proc, as the maximum reported by getrusage
+    includes the memory of the parent process before this process started.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    # Linux reports kilobytes, macOS reports bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
@@ -0,0 +1,320 @@
+"""Local HTTP servers standing in for Crowdin, GitHub, and linked websites.
+
+Each server keeps its state in memory, counts the requests it receives
+by endpoint, and can add a fixed latency to every response to simulate
+the network.
+"""
+
+import io
+import re
+import json
+import time
+import threading
+from zipfile import ZipFile
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Header of a file part in a multipart form, ending at the start of the content
+FILE_FIELD_REGEX = re.compile(rb'name="files\[(.+?)\]"; filename="[^"]*"\r\n(?:[^\r\n]+\r\n)*\r\n')
+WORDS_PER_FILE = 10
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Passes each request to the handle method of the server's service."""
+
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        service = self.server.service
+        (endpoint, status, headers, content) = service.respond(self.command, self.path, body)
+        service.count_request(endpoint)
+        time.sleep(service.latency)
+        self.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    do_GET = handle_request
+    do_HEAD = handle_request
+    do_POST = handle_request
+    do_PATCH = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeService:
+    """Base class for a fake service running on a local port."""
+
+    def __init__(self, latency=0):
+        """Create a service.
+
+        Args:
+            latency: (float) Seconds added to every response.
+        """
+        self.latency = latency
+        self.request_counts = dict()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count_request(self, endpoint):
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.request_counts = dict()
+
+    def respond(self, method, path, body):
+        """Return the endpoint name, status code, headers, and content of a response."""
+        raise NotImplementedError
+
+
+def json_response(endpoint, data, status=200):
+    return (endpoint, status, {"Content-Type": "application/json"}, json.dumps(data).encode("utf-8"))
+
+
+def build_tree(paths, make_file_node):
+    """Build a Crowdin file tree from a set of file paths."""
+    root = {"files": dict()}
+    for path in sorted(paths):
+        node = root
+        segments = path.split("/")
+        for segment in segments[:-1]:
+            node = node["files"].setdefault(segment, {"node_type": "directory", "name": segment, "files": dict()})
+        node["files"][segments[-1]] = make_file_node(segments[-1])
+
+    def convert(node):
+        children = [convert(child) if child["node_type"] == "directory" else child for child in node["files"].values()]
+        return dict(node, files=children)
+    return convert(root)["files"]
+
+
+class FakeCrowdin(FakeService):
+    """Crowdin v1 API for a single project.
+
+    Uploaded source files are stored, and every language has all files
+    fully translated and approved. The translations ZIP contains a copy of
+    each source file for each language.
+    """
+
+    def __init__(self, languages, latency=0):
+        """Create a fake Crowdin project.
+
+        Args:
+            languages: (list of str) Crowdin codes of the project languages,
+                also used as their locale codes.
+        """
+        super().__init__(latency)
+        self.languages = languages
+        self.files = dict()
+        self.directories = set()
+
+    def add_files(self, files):
+        """Add source files to the project, as a dictionary of paths to content."""
+        with self.lock:
+            self.files.update(files)
+
+    def respond(self, method, path, body):
+        url = urlsplit(path)
+        api_method = url.path.split("/", 4)[-1]
+        params = parse_qs(url.query)
+        if api_method in ("add-file", "update-file"):
+            for match in FILE_FIELD_REGEX.finditer(body):
+                file_path = match.group(1).decode("utf-8")
+                content_end = body.find(b"\r\n--", match.end())
+                with self.lock:
+                    self.files[file_path] = body[match.end():content_end]
+            return json_response(api_method, {"success": True})
+        elif api_method == "add-directory":
+            with self.lock:
+                self.directories.add(params["name"][0])
+            return json_response(api_method, {"success": True})
+        elif api_method == "info":
+            with self.lock:
+                tree = build_tree(self.files, lambda name: {"node_type": "file", "name": name})
+            return json_response(api_method, {"files": tree})
+        elif api_method == "supported-languages":
+            return json_response(api_method, [
+                {"crowdin_code": language, "osx_locale": language} for language in self.languages
+            ])
+        elif api_method == "status":
+            return json_response(api_method, [
+                {"code": language, "words_approved": WORDS_PER_FILE} for language in self.languages
+            ])
+        elif api_method == "language-status":
+            with self.lock:
+                tree = build_tree(self.files, lambda name: {
+                    "node_type": "file",
+                    "name": name,
+                    "words": WORDS_PER_FILE,
+                    "words_approved": WORDS_PER_FILE,
+                })
+            return json_response(api_method, {"files": tree})
+        elif api_method == "export":
+            return json_response(api_method, {"success": {"status": "in-progress"}})
+        elif api_method == "export-status":
+            return json_response(api_method, {"status": "finished", "progress": 100})
+        elif api_method == "download/all.zip":
+            return (api_method, 200, {"Content-Type": "application/zip"}, self.build_translations_zip())
+        return json_response(api_method, {"error": {"code": 0, "message": "Unknown method"}}, status=404)
+
+    def build_translations_zip(self):
+        zip_file = io.BytesIO()
+        with self.lock:
+            files = dict(self.files)
+        with ZipFile(zip_file, "w") as translations:
+            for language in self.languages:
+                for (file_path, content) in files.items():
+                    translated_path = file_path.replace("/en/", "/{}/".format(language))
+                    translations.writestr(translated_path, content + "\n{}\n".format(language).encode("utf-8"))
+        return zip_file.getvalue()
+
+
+class FakeGitHub(FakeService):
+    """GitHub GraphQL and REST APIs for the repositories of one owner.
+
+    Only the queries and endpoints used by Arnold are supported. Each
+    repository has open pull requests and issues, which are created
+    through the REST API.
+    """
+
+    def __init__(self, owner, bot_login, latency=0):
+        super().__init__(latency)
+        self.owner = owner
+        self.bot_login = bot_login
+        self.repositories = dict()
+
+    def add_repository(self, name, head):
+        """Add a repository with the given default branch commit SHA."""
+        with self.lock:
+            self.repositories[name] = {"head": head, "pulls": [], "issues": []}
+
+    def get_repository_json(self, name):
+        url = "{}/repos/{}/{}".format(self.url, self.owner, name)
+        return {
+            "id": 1,
+            "name": name,
+            "full_name": "{}/{}".format(self.owner, name),
+            "owner": {"login": self.owner},
+            "url": url,
+            "default_branch": "develop",
+            "ssh_url": "git@github.com:{}/{}.git".format(self.owner, name),
+        }
+
+    def get_issue_json(self, name, issue):
+        url = "{}/repos/{}/{}/issues/{}".format(self.url, self.owner, name, issue["number"])
+        return dict(issue, url=url, labels_url=url + "/labels{/name}", state="open")
+
+    def get_repository_node(self, name):
+        repository = self.repositories[name]
+        return {
+            "name": name,
+            "nameWithOwner": "{}/{}".format(self.owner, name),
+            "pushedAt": repository["head"],
+            "defaultBranchRef": {"target": {"oid": repository["head"]}},
+            "pullRequests": {
+                "pageInfo": {"hasNextPage": False},
+                "nodes": [
+                    {
+                        "number": pull["number"],
+                        "title": pull["title"],
+                        "headRefName": pull["head"],
+                        "baseRefName": pull["base"],
+                        "headRepositoryOwner": {"login": self.owner},
+                    }
+                    for pull in repository["pulls"]
+                ],
+            },
+            "issues": {
+                "pageInfo": {"hasNextPage": False},
+                "nodes": [
+                    {"number": issue["number"], "title": issue["title"], "body": issue["body"]}
+                    for issue in repository["issues"] if not issue["closed"]
+                ],
+            },
+        }
+
+    def respond(self, method, path, body):
+        url = urlsplit(path)
+        data = json.loads(body) if body else dict()
+        if url.path == "/graphql":
+            name = data["variables"]["name"]
+            with self.lock:
+                node = self.get_repository_node(name) if name in self.repositories else None
+            rate_limit = {"cost": 1, "remaining": 5000, "resetAt": "2000-01-01T00:00:00Z"}
+            return json_response("graphql", {"data": {"rateLimit": rate_limit, "repository": node}})
+        segments = url.path.strip("/").split("/")
+        if segments[0] != "repos" or len(segments) < 3 or segments[2] not in self.repositories:
+            return json_response("not_found", {"message": "Not Found"}, status=404)
+        name = segments[2]
+        endpoint = "/".join(["repos"] + [segment if not segment.isdigit() else "N" for segment in segments[3:]])
+        with self.lock:
+            repository = self.repositories[name]
+            if len(segments) == 3:
+                return json_response("get_repo", self.get_repository_json(name))
+            elif segments[3] == "pulls" and method == "POST":
+                pull = {
+                    "number": len(repository["pulls"]) + len(repository["issues"]) + 1,
+                    "title": data["title"],
+                    "head": data["head"],
+                    "base": data["base"],
+                }
+                repository["pulls"].append(pull)
+                issue_url = "{}/repos/{}/{}/issues/{}".format(self.url, self.owner, name, pull["number"])
+                return json_response(endpoint, dict(pull, url=issue_url, issue_url=issue_url, state="open"), 201)
+            elif segments[3] == "issues" and len(segments) == 4 and method == "POST":
+                issue = {
+                    "number": len(repository["pulls"]) + len(repository["issues"]) + 1,
+                    "title": data["title"],
+                    "body": data.get("body"),
+                    "closed": False,
+                }
+                repository["issues"].append(issue)
+                return json_response(endpoint, self.get_issue_json(name, issue), 201)
+            elif segments[3] == "issues" and len(segments) == 5:
+                issue = next(issue for issue in repository["issues"] if issue["number"] == int(segments[4]))
+                if method == "PATCH":
+                    issue["title"] = data.get("title", issue["title"])
+                    issue["body"] = data.get("body", issue["body"])
+                    issue["closed"] = data.get("state") == "closed"
+                return json_response(endpoint, self.get_issue_json(name, issue))
+            elif segments[3] == "issues" and segments[5] == "comments":
+                return json_response(endpoint, {"id": 1, "body": data.get("body")}, 201)
+            elif segments[3] == "issues" and segments[5] == "labels":
+                return json_response(endpoint, [{"name": label} for label in data])
+        return json_response("not_found", {"message": "Not Found"}, status=404)
+
+
+class FakeWebsite(FakeService):
+    """Website with pages that work, are missing, or don't allow HEAD requests.
+
+    The status of each path is set by its first segment: /ok/ pages
+    respond with 200, /missing/ pages with 404, and /no-head/ pages with
+    405 to HEAD requests and 200 to GET requests.
+    """
+
+    def respond(self, method, path, body):
+        page_type = path.strip("/").split("/")[0]
+        if page_type == "missing" or (page_type == "no-head" and method == "HEAD"):
+            status = 405 if page_type == "no-head" else 404
+        else:
+            status = 200
+        return ("{} {}".format(method, page_type), status, {"Content-Type": "text/html"}, b"<html></html>")
@@ -0,0 +1,136 @@
+"""Synthetic repositories for benchmarks.
+
+Each repository is a clone of a local bare repository standing in for
+GitHub, with a develop branch containing translatable source files,
+Python and template files, a Django message file, and content files
+with links.
+"""
+
+import os
+import sys
+import subprocess
+
+BRANCH = "develop"
+SOURCE_DIRECTORY = "content/en"
+MESSAGE_FILE = "locale/en/LC_MESSAGES/django.po"
+LINKS_PER_FILE = 10
+
+MESSAGE_FILE_SCRIPT = """
+import glob, os, time
+messages = sorted(glob.glob("app/**/*.py", recursive=True))
+os.makedirs(os.path.dirname({message_file!r}), exist_ok=True)
+with open({message_file!r}, "w") as f:
+    f.write('msgid ""\\nmsgstr ""\\n"POT-Creation-Date: %s\\\\n"\\n\\n' % time.strftime("%Y-%m-%d %H:%M:%S"))
+    for path in messages:
+        f.write('#: %s:1\\nmsgid "%s"\\nmsgstr ""\\n\\n' % (path, os.path.basename(path)))
+"""
+
+
+def git(arguments, directory):
+    subprocess.run(["git"] + arguments, cwd=directory, check=True, stdout=subprocess.DEVNULL)
+
+
+def get_source_file_content(number):
+    return "# Page {0}\n\nThis is the text of page {0}, which is translated.\n".format(number)
+
+
+def get_source_files(file_count):
+    """Return a dictionary mapping source file paths to content."""
+    return {
+        "{}/page-{}.md".format(SOURCE_DIRECTORY, number): get_source_file_content(number).encode("utf-8")
+        for number in range(file_count)
+    }
+
+
+def get_link_lines(file_number, url_count, file_count, website_urls):
+    """Return lines linking to URLs spread over the websites.
+
+    A tenth of the links are to missing pages, and a tenth to pages that
+    don't allow HEAD requests. Links are repeated across files.
+    """
+    lines = []
+    for link_number in range(LINKS_PER_FILE):
+        url_number = (file_number * LINKS_PER_FILE + link_number) % max(url_count, 1)
+        website_url = website_urls[url_number % len(website_urls)]
+        if url_number % 10 == 1:
+            page_type = "missing"
+        elif url_number % 10 == 2:
+            page_type = "no-head"
+        else:
+            page_type = "ok"
+        lines.append("- [Link {0}]({1}/{2}/{0})\n".format(url_number, website_url, page_type))
+    return lines
+
+
+def create_repository(directory, name, file_count, url_count, website_urls):
+    """Create a synthetic repository and its remote.
+
+    Args:
+        directory: (str) Directory to create the repository and remote in.
+        name: (str) Name of the repository.
+        file_count: (int) Number of translatable source files, content
+            files with links, and Python files.
+        url_count: (int) Number of unique URLs linked from content files.
+        website_urls: (list of str) Base URLs of the websites to link to.
+
+    Returns:
+        Tuple of the path of the working copy, and the default branch
+        commit SHA.
+    """
+    remote = os.path.join(directory, "remotes", name + ".git")
+    working_copy = os.path.join(directory, "projects", name)
+    os.makedirs(remote)
+    git(["init", "--quiet", "--bare"], remote)
+    git(["clone", "--quiet", remote, working_copy], directory)
+    git(["config", "user.name", "Benchmark"], working_copy)
+    git(["config", "user.email", "benchmark@example.com"], working_copy)
+    git(["checkout", "--quiet", "-b", BRANCH], working_copy)
+    files = dict(get_source_files(file_count))
+    for number in range(file_count):
+        files["app/module_{}/views.py".format(number // 10)] = b"from django.utils.translation import gettext\n"
+        files["app/module_{}/view_{}.py".format(number // 10, number)] = "VALUE = {}\n".format(number).encode("utf-8")
+        files["templates/page-{}.html".format(number)] = "<p>{{% trans 'Page {}' %}}</p>\n".format(number).encode()
+        link_lines = get_link_lines(number, url_count, file_count, website_urls)
+        files["docs/page-{}.md".format(number)] = "".join(link_lines).encode("utf-8")
+    for (path, content) in files.items():
+        file_path = os.path.join(working_copy, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(content)
+    subprocess.run(
+        [sys.executable, "-c", MESSAGE_FILE_SCRIPT.format(message_file=MESSAGE_FILE)],
+        cwd=working_copy,
+        check=True,
+    )
+    git(["add", "-A"], working_copy)
+    git(["commit", "--quiet", "-m", "Initial content"], working_copy)
+    git(["push", "--quiet", "origin", BRANCH], working_copy)
+    git(["--git-dir", remote, "symbolic-ref", "HEAD", "refs/heads/" + BRANCH], directory)
+    result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=working_copy, check=True, stdout=subprocess.PIPE)
+    return (working_copy, result.stdout.decode("utf-8").strip())
+
+
+def get_project_config():
+    """Return the Arnold config of a synthetic repository."""
+    message_file_command = [sys.executable, "-c", MESSAGE_FILE_SCRIPT.format(message_file=MESSAGE_FILE)]
+    return {
+        "broken-link-checker": {
+            "exclude-directories": [".git/"],
+            "file-types": ["md"],
+        },
+        "translation": {
+            "branches": {
+                "translation-source": BRANCH,
+                "translation-target": BRANCH,
+                "update-messages-target": BRANCH,
+            },
+            "source-directories": [SOURCE_DIRECTORY.replace("/en", "/{language}") + "/"],
+            "file-types": [".md"],
+            "django-message-file": MESSAGE_FILE,
+            "commands": {
+                "start": ["docker-compose", "up", "-d"],
+                "makemessages": message_file_command,
+                "end": ["docker-compose", "down"],
+            },
+        },
+    }
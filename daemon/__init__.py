@@ -0,0 +1,7 @@
+"""Modules used to run Arnold as a service, driven by webhook events."""
+
+# flake8: noqa
+
+from .jobs import Job, JobQueue, DEFAULT_DEBOUNCE
+from .events import get_job_tasks
+from .server import WebhookServer
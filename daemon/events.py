@@ -0,0 +1,102 @@
+"""Reading webhook events, and finding the tasks affected by a job.
+
+GitHub push events give the branch and the paths changed, and Crowdin
+file translated and approved events give the Crowdin project and the
+language. A job's tasks are chosen from the repository's Arnold config,
+so a push only runs the tasks whose branch and files it changed, and
+translations are only pulled for the languages changed.
+"""
+
+import hmac
+import hashlib
+from fnmatch import fnmatch
+
+BRANCH_REF_PREFIX = "refs/heads/"
+SIGNATURE_PREFIX = "sha256="
+# Crowdin events for new translations or approvals in a language
+CROWDIN_EVENTS = ("file.translated", "file.proofread", "file.approved", "project.translated", "project.proofread")
+# Linkie's default file types, used when the config doesn't set any
+DEFAULT_LINK_FILE_TYPES = ["html", "md", "rst", "txt"]
+
+
+def is_valid_signature(secret, body, signature):
+    """Return True if a GitHub X-Hub-Signature-256 header matches the body."""
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(SIGNATURE_PREFIX + digest, signature or "")
+
+
+def read_push_event(payload):
+    """Read a GitHub push event.
+
+    Returns:
+        Tuple of the repository name, branch, and set of changed paths
+        (or None if the changed paths are unknown, such as after a force
+        push), or None if the push isn't to a branch.
+    """
+    ref = payload.get("ref", "")
+    if not ref.startswith(BRANCH_REF_PREFIX) or payload.get("deleted"):
+        return None
+    if payload.get("forced") or payload.get("created"):
+        paths = None
+    else:
+        paths = set()
+        for commit in payload.get("commits", []):
+            for key in ("added", "modified", "removed"):
+                paths.update(commit.get(key, []))
+    return (payload["repository"]["name"], ref[len(BRANCH_REF_PREFIX):], paths)
+
+
+def read_crowdin_event(params):
+    """Read a Crowdin webhook event.
+
+    Args:
+        params: (dict) Parameters of the webhook request.
+
+    Returns:
+        Tuple of the Crowdin project identifier and language code, or None
+        if the event isn't for translated or approved files.
+    """
+    if params.get("event") not in CROWDIN_EVENTS or not params.get("project") or not params.get("language"):
+        return None
+    return (params["project"], params["language"])
+
+
+def matches_any(paths, patterns):
+    """Return True if any path matches any pattern, or the paths are unknown."""
+    if paths is None:
+        return True
+    return any(fnmatch(path, pattern) for path in paths for pattern in patterns)
+
+
+def get_job_tasks(job, config, default_branch):
+    """Return the set of tasks affected by the events of a job.
+
+    Args:
+        job: (Job) Job of the repository.
+        config: (dict) Arnold config of the repository.
+        default_branch: (str) Name of the repository's default branch.
+    """
+    # Imported here, so starting Arnold doesn't import the translation tasks
+    from translation.constants import SOURCE_LANGUAGE
+    from translation.message_sources import DEFAULT_SOURCE_PATTERNS
+    tasks = set()
+    link_config = config.get("broken-link-checker")
+    translation_config = config.get("translation")
+    for (branch, paths) in job.changed_paths.items():
+        if link_config and branch == default_branch:
+            file_types = link_config.get("file-types") or DEFAULT_LINK_FILE_TYPES
+            if matches_any(paths, ["*." + file_type.lstrip(".") for file_type in file_types]):
+                tasks.add("link-checker")
+        if translation_config and branch == translation_config["branches"]["translation-source"]:
+            source_patterns = [
+                source_directory.format(language=SOURCE_LANGUAGE).rstrip("/") + "/*"
+                for source_directory in translation_config["source-directories"]
+            ]
+            if matches_any(paths, source_patterns):
+                tasks.add("push-source-files")
+            message_patterns = translation_config.get("message-source-files", DEFAULT_SOURCE_PATTERNS)
+            if matches_any(paths, message_patterns):
+                tasks.add("update-source-message-files")
+    if translation_config and job.languages:
+        tasks.update(["build-project", "pull-translations"])
+    return tasks
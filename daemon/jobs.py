@@ -0,0 +1,99 @@
+"""Coalescing webhook events into a job for each repository."""
+
+import time
+import threading
+
+# Seconds without new events for a repository before its job runs
+DEFAULT_DEBOUNCE = 60
+# Maximum seconds a job is delayed by new events
+MAX_DELAY = 10 * 60
+
+
+class Job:
+    """Work for a single repository, built from one or more events."""
+
+    def __init__(self, repository):
+        self.repository = repository
+        # Paths changed by pushes to each branch, or None if unknown
+        self.changed_paths = dict()
+        # Crowdin codes of languages with new translations or approvals
+        self.languages = set()
+        self.event_count = 0
+        self.first_event_time = time.monotonic()
+        self.last_event_time = self.first_event_time
+
+    def add_push(self, branch, paths):
+        if paths is None or self.changed_paths.get(branch, set()) is None:
+            self.changed_paths[branch] = None
+        else:
+            self.changed_paths.setdefault(branch, set()).update(paths)
+
+    def add_translation(self, language):
+        self.languages.add(language)
+
+
+class JobQueue:
+    """Jobs waiting to run, with the events for each repository coalesced.
+
+    A job is due once no events for its repository have arrived for the
+    debounce period, or once it has waited for the maximum delay, so a
+    burst of pushes or approvals results in a single job. Events arriving
+    while a repository's job runs are added to a new job.
+    """
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE, max_delay=MAX_DELAY):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.jobs = dict()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def add_push(self, repository, branch, paths):
+        """Add a push of the given paths (or None if unknown) to a branch."""
+        with self.condition:
+            self.get_pending_job(repository).add_push(branch, paths)
+            self.condition.notify()
+
+    def add_translation(self, repository, language):
+        """Add new translations or approvals for a Crowdin language code."""
+        with self.condition:
+            self.get_pending_job(repository).add_translation(language)
+            self.condition.notify()
+
+    def get_pending_job(self, repository):
+        """Return the pending job of a repository, recording a new event for it."""
+        job = self.jobs.get(repository)
+        if job is None:
+            job = Job(repository)
+            self.jobs[repository] = job
+        job.event_count += 1
+        job.last_event_time = time.monotonic()
+        return job
+
+    def get_due_time(self, job):
+        return min(job.last_event_time + self.debounce, job.first_event_time + self.max_delay)
+
+    def get(self):
+        """Wait until a job is due, and remove it from the queue.
+
+        Returns:
+            The job, or None if the queue was stopped.
+        """
+        with self.condition:
+            while not self.stopped:
+                if not self.jobs:
+                    self.condition.wait()
+                    continue
+                job = min(self.jobs.values(), key=self.get_due_time)
+                wait_time = self.get_due_time(job) - time.monotonic()
+                if wait_time <= 0:
+                    del self.jobs[job.repository]
+                    return job
+                self.condition.wait(wait_time)
+            return None
+
+    def stop(self):
+        """Stop waiting for jobs, leaving any pending jobs unrun."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
@@ -0,0 +1,95 @@
+"""HTTP server receiving webhook events from GitHub and Crowdin."""
+
+import hmac
+import json
+import logging
+from urllib.parse import urlsplit, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .events import is_valid_signature, read_push_event, read_crowdin_event
+
+GITHUB_PATH = "/github"
+CROWDIN_PATH = "/crowdin"
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Passes each webhook request to the server."""
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        url = urlsplit(self.path)
+        if url.path == GITHUB_PATH and self.command == "POST":
+            status = self.server.handle_github_event(self.headers, body)
+        elif url.path == CROWDIN_PATH:
+            # Crowdin sends event parameters in the URL or as a form
+            params = dict(parse_qsl(url.query))
+            params.update(parse_qsl(body.decode("utf-8", "replace")))
+            status = self.server.handle_crowdin_event(params)
+        else:
+            status = 404
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+    def log_message(self, format, *args):
+        logging.debug("Webhook request: " + format % args)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Accepts webhook events, and adds them to a job queue.
+
+    GitHub requests are checked against the webhook secret, and Crowdin
+    requests must include the token parameter, so only GitHub and Crowdin
+    can start jobs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, job_queue, github_secret, crowdin_token):
+        if not github_secret or not crowdin_token:
+            raise ValueError("The GitHub webhook secret and Crowdin webhook token must be set.")
+        super().__init__(address, WebhookRequestHandler)
+        self.job_queue = job_queue
+        self.github_secret = github_secret
+        self.crowdin_token = crowdin_token
+
+    def handle_github_event(self, headers, body):
+        """Add a GitHub event to the job queue, returning the response status."""
+        if not is_valid_signature(
+            self.github_secret,
+            body,
+            headers.get("X-Hub-Signature-256"),
+        ):
+            logging.warning("Ignoring GitHub event with invalid signature.")
+            return 401
+        if headers.get("X-GitHub-Event") != "push":
+            return 204
+        try:
+            push = read_push_event(json.loads(body))
+        except (ValueError, KeyError, TypeError):
+            return 400
+        if push:
+            (repository, branch, paths) = push
+            logging.info("Received push to {} branch of {} ({} paths).".format(
+                branch,
+                repository,
+                "unknown" if paths is None else len(paths),
+            ))
+            self.job_queue.add_push(repository, branch, paths)
+        return 202
+
+    def handle_crowdin_event(self, params):
+        """Add a Crowdin event to the job queue, returning the response status."""
+        if not hmac.compare_digest(params.get("token", "").encode("utf-8"), self.crowdin_token.encode("utf-8")):
+            logging.warning("Ignoring Crowdin event with invalid token.")
+            return 401
+        translation = read_crowdin_event(params)
+        if translation is None:
+            return 204
+        (project, language) = translation
+        logging.info("Received '{}' Crowdin event for {} ({}).".format(params["event"], project, language))
+        self.job_queue.add_translation(project, language)
+        return 202
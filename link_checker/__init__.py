@@ -1,14 +1,71 @@
+import os
+import copy
 import logging
-from linkie import Linkie
 from utils import render_text
+from utils.github_api import get_bot_issues
+from metrics import span
+from .link_cache import (
+    CachedLinkie,
+    load_url_cache,
+    save_url_cache,
+    load_file_index,
+    save_file_index,
+)
+from .url_checker import (
+    URLChecker,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_HOST_CONNECTIONS,
+    DEFAULT_HOST_REQUEST_INTERVAL,
+)
+
+WORKTREE_DIRECTORY = "link-checker"
 
 
 def check_links(project):
-    """ """
+    """Check the links in the repository, and open or update an issue for broken links.
+
+    Files are searched in a separate worktree of the commit checked out
+    when the project started running, so other tasks can change the
+    working copy at the same time.
+    """
+    worktree = os.path.join(project.cache_directory, WORKTREE_DIRECTORY)
+    project.git.add_worktree(worktree, project.head_commit, options=["--detach"])
+    try:
+        (checker, result) = run_link_checker(project, worktree)
+    finally:
+        project.git.remove_worktree(worktree)
+    report_broken_links(project, checker, result)
+
+
+def run_link_checker(project, directory):
+    """Check the links in the files of a directory.
+
+    Returns:
+        Tuple of the link checker, and its result (1 if any links are
+        broken, otherwise 0).
+    """
     linkie_config = project.config.get("broken-link-checker", dict())
-    checker = Linkie(config=linkie_config)
+    url_checker = URLChecker(
+        max_connections=linkie_config.get("max-connections", DEFAULT_MAX_CONNECTIONS),
+        max_host_connections=linkie_config.get("max-host-connections", DEFAULT_MAX_HOST_CONNECTIONS),
+        host_request_interval=linkie_config.get("host-request-interval", DEFAULT_HOST_REQUEST_INTERVAL),
+    )
+    checker = CachedLinkie(
+        load_url_cache(project.shared_cache_directory),
+        load_file_index(project),
+        url_checker,
+        directory=directory,
+        # Linkie changes the config it is given
+        config=copy.deepcopy(linkie_config),
+    )
     result = checker.run()
+    save_url_cache(project.shared_cache_directory, checker.new_url_results)
+    save_file_index(project, checker.used_file_index)
+    return (checker, result)
+
 
+def report_broken_links(project, checker, result):
+    """Open, update or close the bot's broken link issue to match the result."""
     broken_links = dict()
     for url, url_data in checker.urls.items():
         if url_data['broken']:
@@ -22,32 +79,36 @@ def check_links(project):
     header_text = render_text("link_checker/templates/issue-broken-links-header.txt", context)
     body_text = render_text("link_checker/templates/issue-broken-links-body.txt", context)
 
-    bot_issues = project.repo.get_issues(creator=project.bot)
     existing_issue = None
-    for issue in bot_issues:
-        if "broken link" in issue.title:
+    for issue in get_bot_issues(project):
+        if "broken link" in issue["title"]:
             existing_issue = issue
 
     # If existing issue and no errors, close issue
     if existing_issue and not result:
         message = "Closing existing issue, as link checker now detects no broken links."
         logging.info(message)
-        existing_issue.create_comment(message)
-        existing_issue.edit(state="closed")
+        with span("github", "close_issue"):
+            issue = project.repo.get_issue(existing_issue["number"])
+            issue.create_comment(message)
+            issue.edit(state="closed")
     # Else if existing issue and errors
     elif existing_issue and result:
         logging.info("Checking if existing issue matches result.")
-        if header_text == existing_issue.title and body_text == existing_issue.body:
+        if header_text == existing_issue["title"] and body_text == existing_issue["body"]:
             logging.info("Existing issue is up to date.")
         else:
             message = "Updating issue to match latest broken link checker results."
             logging.info(message)
-            existing_issue.edit(title=header_text, body=body_text)
-            existing_issue.create_comment(message)
+            with span("github", "update_issue"):
+                issue = project.repo.get_issue(existing_issue["number"])
+                issue.edit(title=header_text, body=body_text)
+                issue.create_comment(message)
     # Else if no existing issue and errors, create issue
     elif not existing_issue and result:
-        issue = project.repo.create_issue(
-            title=header_text,
-            body=body_text,
-        )
-        issue.add_to_labels("bug")
+        with span("github", "create_issue"):
+            issue = project.repo.create_issue(
+                title=header_text,
+                body=body_text,
+            )
+            issue.add_to_labels("bug")
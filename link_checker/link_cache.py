@@ -0,0 +1,185 @@
+"""Caches used to check links incrementally.
+
+The URL cache is shared by all repositories, and stores the result of
+each URL checked with the time it was checked. Results are reused until
+they expire, which takes longer for working links than broken links.
+
+The file index is stored per project, and maps the content hash of each
+file searched to the URLs found in it, so unchanged files are not
+searched again.
+"""
+
+import os
+import time
+import logging
+from utils import get_file_hash, file_lock, import_keeping_log_handlers, read_json_file, write_json_file
+
+Linkie = import_keeping_log_handlers("linkie").Linkie
+
+URL_CACHE_FILENAME = "link-cache.json"
+URL_CACHE_LOCK_FILENAME = "link-cache.lock"
+FILE_INDEX_FILENAME = "link-index.json"
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# Seconds each result is reused for, by type of status
+WORKING_LINK_TTL = 7 * DAY
+MISSING_LINK_TTL = DAY
+CLIENT_ERROR_TTL = 6 * HOUR
+SERVER_ERROR_TTL = HOUR
+MISSING_STATUS_CODES = (404, 410)
+
+
+def get_result_ttl(status):
+    """Return the number of seconds a result with the given status is reused for.
+
+    Args:
+        status: (int or str) Status code, or name of the exception raised
+            while requesting the URL.
+    """
+    if isinstance(status, str) or status >= 500:
+        return SERVER_ERROR_TTL
+    if status in MISSING_STATUS_CODES:
+        return MISSING_LINK_TTL
+    if status >= 400:
+        return CLIENT_ERROR_TTL
+    return WORKING_LINK_TTL
+
+
+def is_expired(result, now):
+    return now - result["checked_at"] > get_result_ttl(result["status"])
+
+
+def load_url_cache(cache_directory):
+    """Return the URL results that have not expired.
+
+    Returns:
+        Dictionary mapping URLs to dictionaries with the status, whether
+        the link is broken, and the time it was checked.
+    """
+    now = time.time()
+    results = read_json_file(os.path.join(cache_directory, URL_CACHE_FILENAME), "urls", dict())
+    return {url: result for (url, result) in results.items() if not is_expired(result, now)}
+
+
+def save_url_cache(cache_directory, new_results):
+    """Add new URL results to the URL cache.
+
+    The cache is locked while it is updated, so results from repositories
+    checked at the same time are kept. Expired results are removed.
+    """
+    cache_path = os.path.join(cache_directory, URL_CACHE_FILENAME)
+    with file_lock(os.path.join(cache_directory, URL_CACHE_LOCK_FILENAME)):
+        results = load_url_cache(cache_directory)
+        results.update(new_results)
+        write_json_file(cache_path, "urls", results)
+
+
+def load_file_index(project):
+    return read_json_file(os.path.join(project.cache_directory, FILE_INDEX_FILENAME), "files", dict())
+
+
+def save_file_index(project, file_index):
+    write_json_file(os.path.join(project.cache_directory, FILE_INDEX_FILENAME), "files", file_index)
+
+
+class CachedLinkie(Linkie):
+    """Link checker that reuses results from previous runs.
+
+    Files with a content hash in the file index are not searched again,
+    and URLs with an unexpired result in the URL cache are not requested
+    again. All other unique URLs found are checked together by a
+    URLChecker, instead of Linkie's thread pool. Results found by this
+    checker are kept in new_url_results and used_file_index, to be saved
+    once checking is complete.
+    """
+
+    def __init__(self, url_cache, file_index, url_checker, directory=".", **kwargs):
+        """Create a link checker.
+
+        Args:
+            url_cache: (dict) Unexpired URL results, as returned by load_url_cache.
+            file_index: (dict) Mapping of file hashes to lists of URLs found.
+            url_checker: (URLChecker) Checker to request URLs with.
+            directory: (str) Directory to search for files.
+            kwargs: (dict) Arguments for Linkie.
+        """
+        super().__init__(**kwargs)
+        # Linkie's thread pool isn't used
+        self.pool.close()
+        # Linkie makes excluded directories relative to the current directory
+        self.directory = directory
+        self.config["exclude-directories"] = [
+            os.path.join(directory, os.path.relpath(excluded_directory))
+            for excluded_directory in self.config["exclude-directories"]
+        ]
+        self.url_checker = url_checker
+        self.url_cache = url_cache
+        self.file_index = file_index
+        self.used_file_index = dict()
+        self.new_url_results = dict()
+        self.cached_file_count = 0
+        self.cached_url_count = 0
+
+    def search_file(self, file_path):
+        file_hash = get_file_hash(file_path)
+        urls = self.file_index.get(file_hash)
+        if urls is None:
+            # Collect the URLs found by Linkie separately, to index them
+            all_urls = self.unchecked_urls
+            self.unchecked_urls = set()
+            super().search_file(file_path)
+            urls = sorted(self.unchecked_urls)
+            self.unchecked_urls = all_urls
+        else:
+            self.file_count += 1
+            self.cached_file_count += 1
+            for url in urls:
+                self.domains[self.get_domain(url)] = -1
+        self.unchecked_urls.update(urls)
+        self.used_file_index[file_hash] = urls
+
+    def find_files(self):
+        """Yield the path of each file to search, as found by Linkie."""
+        for (directory_root, directories, files) in os.walk(self.directory):
+            directories[:] = [
+                directory for directory in directories
+                if os.path.join(directory_root, directory) not in self.config["exclude-directories"]
+            ]
+            for filename in files:
+                if filename.endswith(self.config["file-types"]):
+                    yield os.path.join(directory_root, filename)
+
+    def traverse_directory(self):
+        for file_path in self.find_files():
+            self.search_file(file_path)
+        urls_to_check = []
+        for url in sorted(self.unchecked_urls):
+            result = self.url_cache.get(url)
+            if url in self.config["skip-urls"]:
+                logging.info("  - Skipping URL (as defined in config file) = {}".format(url))
+            elif result:
+                self.save_url(url, result["status"], result["broken"])
+                self.cached_url_count += 1
+            else:
+                urls_to_check.append(url)
+        checked_at = time.time()
+        for (url, result) in self.url_checker.check_urls(urls_to_check).items():
+            self.save_url(url, result["status"], result["broken"])
+            self.new_url_results[url] = {
+                "status": result["status"],
+                "broken": result["broken"],
+                "checked_at": checked_at,
+            }
+
+    def traverse_connection_errors(self):
+        # Connection errors are retried by the URL checker
+        pass
+
+    def print_summary(self):
+        logging.info("{} of {} files unchanged, {} of {} URLs reused from previous checks.".format(
+            self.cached_file_count,
+            self.file_count,
+            self.cached_url_count,
+            len(self.urls),
+        ))
+        super().print_summary()
@@ -0,0 +1,158 @@
+"""Concurrent checking of URLs, with limits for each host.
+
+Requests are scheduled with asyncio and sent by a pool of threads, each
+with its own keep-alive session. The number of requests in progress is
+limited in total and for each host, and requests to the same host are
+spaced at least a minimum interval apart. Hosts that respond with 429
+(too many requests) are paused for the time they ask for.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from utils import import_keeping_log_handlers
+from utils.retries import get_retry_after
+
+HEADERS = import_keeping_log_handlers("linkie.linkie").HEADERS
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_HOST_CONNECTIONS = 4
+# Minimum seconds between the start of requests to the same host
+DEFAULT_HOST_REQUEST_INTERVAL = 0.25
+# Seconds to wait to connect, and between bytes received
+REQUEST_TIMEOUT = (10, 30)
+# Attempts for each URL that responds with 429 or fails to connect
+MAX_ATTEMPTS = 3
+DEFAULT_RETRY_AFTER = 60
+MAX_RETRY_AFTER = 300
+
+
+class HostLimiter:
+    """Limits on the requests to a single host."""
+
+    def __init__(self, max_connections, request_interval):
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.lock = asyncio.Lock()
+        self.request_interval = request_interval
+        self.next_request_time = 0
+
+    async def wait_for_turn(self):
+        """Wait until a request may be started, and reserve the next slot."""
+        async with self.lock:
+            delay = self.next_request_time - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_request_time = max(self.next_request_time, time.monotonic()) + self.request_interval
+
+    def pause(self, seconds):
+        """Delay all following requests to the host by the given seconds."""
+        self.next_request_time = max(self.next_request_time, time.monotonic() + seconds)
+
+
+class URLChecker:
+    """Checks whether each of a set of URLs works."""
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_host_connections=DEFAULT_MAX_HOST_CONNECTIONS,
+                 host_request_interval=DEFAULT_HOST_REQUEST_INTERVAL):
+        """Create a URL checker.
+
+        Args:
+            max_connections: (int) Maximum number of requests in progress.
+            max_host_connections: (int) Maximum number of requests in
+                progress to a single host.
+            host_request_interval: (float) Minimum seconds between the
+                start of requests to a single host.
+        """
+        self.max_connections = max_connections
+        self.max_host_connections = max_host_connections
+        self.host_request_interval = host_request_interval
+        self.thread_data = threading.local()
+
+    def check_urls(self, urls):
+        """Check each URL, requesting each at most once (unless retried).
+
+        Returns:
+            Dictionary mapping each URL to a dictionary with its status
+            (status code, or name of the exception raised) and whether it
+            is broken.
+        """
+        if not urls:
+            return dict()
+        logging.info("Checking {} URLs with up to {} connections ({} per host)...".format(
+            len(urls),
+            self.max_connections,
+            self.max_host_connections,
+        ))
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            return asyncio.run(self.check_all(sorted(set(urls)), executor))
+
+    async def check_all(self, urls, executor):
+        semaphore = asyncio.Semaphore(self.max_connections)
+        hosts = dict()
+        for url in urls:
+            host = urlsplit(url).netloc.lower()
+            if host not in hosts:
+                hosts[host] = HostLimiter(self.max_host_connections, self.host_request_interval)
+        statuses = await asyncio.gather(*[
+            self.check_url(url, hosts[urlsplit(url).netloc.lower()], semaphore, executor)
+            for url in urls
+        ])
+        results = dict()
+        for (url, status) in zip(urls, statuses):
+            broken = isinstance(status, str) or status >= 400
+            results[url] = {"status": status, "broken": broken}
+        return results
+
+    async def check_url(self, url, host, semaphore, executor):
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            async with host.semaphore:
+                await host.wait_for_turn()
+                async with semaphore:
+                    (status, retry_after) = await loop.run_in_executor(executor, self.request_status, url)
+            if status == 429:
+                host.pause(retry_after)
+                message = "Status 429 => Delaying requests to the host for {:.0f} seconds".format(retry_after)
+            elif status == "ConnectionError":
+                message = "ConnectionError"
+            else:
+                break
+            if attempt < MAX_ATTEMPTS:
+                logging.info("  - {} (attempt {} of {}) = {}".format(message, attempt, MAX_ATTEMPTS, url))
+        if isinstance(status, str):
+            logging.info("  - {} = {}".format(status, url))
+        else:
+            logging.info("  - Status {} = {}".format(status, url))
+        return status
+
+    def request_status(self, url):
+        """Request a URL, trying HEAD and then GET if HEAD fails.
+
+        Returns:
+            Tuple of status (status code, or name of the exception raised)
+            and seconds requested by any Retry-After header.
+        """
+        session = self.get_session()
+        try:
+            response = session.head(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+            response.close()
+            # If response doesn't allow HEAD request, try GET request
+            if response.status_code >= 400 and response.status_code != 429:
+                response = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT, stream=True)
+                response.close()
+        except Exception as e:
+            return (type(e).__name__, 0)
+        if response.status_code != 429:
+            return (response.status_code, 0)
+        return (response.status_code, get_retry_after(response, DEFAULT_RETRY_AFTER, MAX_RETRY_AFTER))
+
+    def get_session(self):
+        """Return the requests session of the current thread."""
+        session = getattr(self.thread_data, "session", None)
+        if session is None:
+            session = requests.Session()
+            self.thread_data.session = session
+        return session
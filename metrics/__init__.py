@@ -0,0 +1,205 @@
+"""Timing and metrics instrumentation.
+
+Work is measured in spans, such as a repository, a task, a shell command
+or an API call. Each finished span is logged with structured fields, and
+all spans of a run are written to a JSON report and a Prometheus textfile
+when the run ends.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+PROMETHEUS_FILENAME = "arnold.prom"
+REPORT_FILENAME = "run-{}.json"
+
+recorded_spans = []
+recorded_spans_lock = threading.Lock()
+base_labels = dict()
+thread_context = threading.local()
+
+
+class Span:
+    """A measured unit of work."""
+
+    def __init__(self, kind, name, labels):
+        self.kind = kind
+        self.name = name
+        self.labels = labels
+        self.start_time = time.time()
+        self.duration = None
+        self.outcome = "success"
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "labels": self.labels,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "outcome": self.outcome,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+def get_span_stack():
+    if not hasattr(thread_context, "stack"):
+        thread_context.stack = []
+    return thread_context.stack
+
+
+def set_base_labels(**labels):
+    """Set labels added to every following span, such as the repository."""
+    base_labels.clear()
+    base_labels.update(labels)
+
+
+def get_current_labels():
+    """Return the labels of the current span on this thread, or the base labels outside a span."""
+    stack = get_span_stack()
+    labels = dict(base_labels)
+    if stack:
+        labels.update(stack[-1].labels)
+    return labels
+
+
+@contextmanager
+def span(kind, name, **labels):
+    """Measure the work done inside the context.
+
+    The span inherits the labels of the enclosing span on the same thread.
+    Its outcome is set to "error" if an exception is raised, and the
+    retries and byte counts can be set on the yielded span.
+
+    Args:
+        kind: (str) Kind of work, for example "task" or "crowdin".
+        name: (str) Name of the work, for example the API method.
+        labels: (dict) Extra labels to record.
+
+    Yields:
+        Span object.
+    """
+    stack = get_span_stack()
+    span_labels = get_current_labels()
+    span_labels.update(labels)
+    current_span = Span(kind, name, span_labels)
+    stack.append(current_span)
+    start_time = timer()
+    try:
+        yield current_span
+    except BaseException:
+        current_span.outcome = "error"
+        raise
+    finally:
+        current_span.duration = timer() - start_time
+        stack.pop()
+        record_span(current_span)
+
+
+def record_span(finished_span):
+    span_data = finished_span.as_dict()
+    with recorded_spans_lock:
+        recorded_spans.append(span_data)
+    logging.info(
+        "{} '{}' took {} ({}).".format(
+            finished_span.kind.capitalize(),
+            finished_span.name,
+            format_duration(finished_span.duration),
+            finished_span.outcome,
+        ),
+        extra={"json_fields": span_data},
+    )
+
+
+def get_recorded_spans():
+    with recorded_spans_lock:
+        return list(recorded_spans)
+
+
+def add_recorded_spans(spans):
+    """Add spans recorded in another process."""
+    with recorded_spans_lock:
+        recorded_spans.extend(spans)
+
+
+def clear_recorded_spans():
+    """Remove all recorded spans, such as once they have been reported."""
+    with recorded_spans_lock:
+        recorded_spans.clear()
+
+
+def format_duration(seconds):
+    mins, secs = divmod(seconds, 60)
+    return "{:.0f}m {:.1f}s".format(mins, secs)
+
+
+def write_report(directory):
+    """Write all recorded spans to a JSON report and a Prometheus textfile.
+
+    The JSON report is named after the run start time, and the Prometheus
+    textfile is overwritten each run, for use with a textfile collector.
+
+    Returns:
+        Path of the JSON report.
+    """
+    # Imported here, as utils imports metrics
+    from utils import write_json_file, write_file_atomically
+
+    spans = get_recorded_spans()
+    report_path = os.path.join(directory, REPORT_FILENAME.format(time.strftime("%Y%m%d-%H%M%S")))
+    write_json_file(report_path, "spans", spans)
+    write_file_atomically(os.path.join(directory, PROMETHEUS_FILENAME), format_prometheus(spans))
+    logging.info("Metrics report written to {}".format(report_path))
+    return report_path
+
+
+def format_prometheus(spans):
+    """Return spans aggregated in the Prometheus text exposition format."""
+    totals = dict()
+    for span_data in spans:
+        key = (
+            span_data["kind"],
+            span_data["name"],
+            span_data["labels"].get("repo", ""),
+            span_data["outcome"],
+        )
+        total = totals.setdefault(key, [0, 0.0, 0, 0, 0])
+        total[0] += 1
+        total[1] += span_data["duration"]
+        total[2] += span_data["retries"]
+        total[3] += span_data["bytes_sent"]
+        total[4] += span_data["bytes_received"]
+
+    metrics = [
+        ("arnold_spans_total", "counter", "Number of spans.", 0),
+        ("arnold_span_duration_seconds_total", "counter", "Total duration of spans.", 1),
+        ("arnold_span_retries_total", "counter", "Total retries within spans.", 2),
+        ("arnold_span_bytes_sent_total", "counter", "Total bytes sent within spans.", 3),
+        ("arnold_span_bytes_received_total", "counter", "Total bytes received within spans.", 4),
+    ]
+    lines = []
+    for (metric_name, metric_type, description, index) in metrics:
+        lines.append("# HELP {} {}".format(metric_name, description))
+        lines.append("# TYPE {} {}".format(metric_name, metric_type))
+        for (key, total) in sorted(totals.items()):
+            labels = ",".join(
+                '{}="{}"'.format(label, escape_label_value(value))
+                for (label, value) in zip(("kind", "name", "repo", "outcome"), key)
+            )
+            lines.append("{}{{{}}} {}".format(metric_name, labels, total[index]))
+    lines.append("# HELP arnold_last_run_timestamp_seconds Time the last run finished.")
+    lines.append("# TYPE arnold_last_run_timestamp_seconds gauge")
+    lines.append("arnold_last_run_timestamp_seconds {}".format(time.time()))
+    return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
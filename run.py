@@ -1,33 +1,53 @@
 import os
 import sys
 import logging
-import base64
-import yaml
+import importlib
+import subprocess
 from shutil import rmtree
 from utils import (
     run_shell,
     read_secrets,
-    display_elapsed_time,
     get_crowdin_api_key,
+    RepositoryLogFilter,
+    RepositoryLogFormatter,
+    remove_directory,
+    is_git_directory,
+    is_shallow_clone,
+    has_alternates,
+    update_mirror,
+    reset_working_copy,
 )
-from translation import (
-    update_source_message_file,
-    push_source_files,
-    build_project,
-    pull_translations,
+from utils.git import GitRepository
+from utils.task_graph import run_task_graph, FAILED
+from utils.run_journal import RunJournal, get_input_hash, get_unit_name
+from utils.github_api import GitHubClient, load_repository_index, load_file_texts
+from utils.config_index import load_config_index, save_config_index, update_config_index
+from utils.cloud_logging import AsyncCloudLoggingHandler, flush_log_handlers
+from daemon.jobs import DEFAULT_DEBOUNCE
+from metrics import (
+    span,
+    set_base_labels,
+    get_recorded_spans,
+    add_recorded_spans,
+    write_report,
+    clear_recorded_spans,
 )
-from link_checker import check_links
 import argparse
-import github
-import google.cloud.logging
-from google.cloud.logging.handlers import CloudLoggingHandler, setup_logging
-from google.auth.exceptions import DefaultCredentialsError
+import threading
+import multiprocessing
 from timeit import default_timer as timer
 
 DEFAULT_WORKING_DIRECTORY = os.getcwd()
 PROJECT_DIRECTORY = "projects"
+CACHE_DIRECTORY = os.path.join(DEFAULT_WORKING_DIRECTORY, "cache")
+MIRROR_DIRECTORY = os.path.join(CACHE_DIRECTORY, "mirrors")
+PROJECT_CACHE_DIRECTORY = os.path.join(CACHE_DIRECTORY, "projects")
+METRICS_DIRECTORY = os.path.join(CACHE_DIRECTORY, "metrics")
+DEFAULT_DOCKER_CACHE_SIZE = 8
 GITHUB_BOT_EMAIL = "33709036+uccser-bot@users.noreply.github.com"
 GITHUB_BOT_NAME = "UCCSER Bot"
+GITHUB_BOT_USERNAME = "uccser-bot"
+GITHUB_ORGANISATION = "uccser"
 REQUIRED_SECRETS = [
     ["GITHUB_TOKEN", "OAuth token to use for GitHub API requests"],
 ]
@@ -36,23 +56,54 @@ SEPERATOR_WIDTH = 60
 MAJOR_SEPERATOR = "=" * SEPERATOR_WIDTH
 MINOR_SEPERATOR = "-" * SEPERATOR_WIDTH
 ALL_TASKS_KEYWORD = "all"
-TASKS = [
-    "link-checker",
-    "update-source-message-files",
-    "push-source-files",
-    "build-project",
-    "pull-translations",
+SERVE_KEYWORD = "serve"
+DEFAULT_PORT = 8080
+# Secrets used to check webhook requests, as anyone reaching the port could start jobs
+WEBHOOK_SECRETS = [
+    ["GITHUB_WEBHOOK_SECRET", "Secret of the GitHub webhook, to check push events"],
+    ["CROWDIN_WEBHOOK_TOKEN", "Token parameter of the Crowdin webhook URL, to check translation events"],
 ]
-TASK_KEYWORDS = dict()
-for keyword in TASKS:
-    TASK_KEYWORDS[keyword] = [keyword, ALL_TASKS_KEYWORD]
+# Journal of the webhook service, kept apart from the journal resumed by --resume
+SERVICE_JOURNAL_FILENAME = "service-journal.json"
+# Each task, with the module and function that run it, the top level
+# config key that enables it, and the tasks it depends on when they are
+# run together. Tasks without a dependency between them run at the same
+# time. Task modules are only imported when the task is run.
+TASK_GRAPH = {
+    "link-checker": {
+        "module": "link_checker",
+        "function": "check_links",
+        "config-key": "broken-link-checker",
+        "dependencies": [],
+    },
+    "update-source-message-files": {
+        "module": "translation",
+        "function": "update_source_message_file",
+        "config-key": "translation",
+        "dependencies": [],
+    },
+    "push-source-files": {
+        "module": "translation",
+        "function": "push_source_files",
+        "config-key": "translation",
+        "dependencies": ["update-source-message-files"],
+    },
+    "build-project": {
+        "module": "translation",
+        "function": "build_project",
+        "config-key": "translation",
+        "dependencies": ["push-source-files"],
+    },
+    "pull-translations": {
+        "module": "translation",
+        "function": "pull_translations",
+        "config-key": "translation",
+        "dependencies": ["build-project"],
+    },
+}
+TASK_CONFIG_KEYS = {task: task_data["config-key"] for (task, task_data) in TASK_GRAPH.items()}
 
 logging.getLogger().setLevel(logging.INFO)
-try:
-    client = google.cloud.logging.Client()
-    client.setup_logging(log_level=logging.INFO)
-except DefaultCredentialsError:
-    logging.info("Only logging locally.")
 
 # From https://stackoverflow.com/a/16993115
 def handle_exception(exc_type, exc_value, exc_traceback):
@@ -60,61 +111,279 @@ def handle_exception(exc_type, exc_value, exc_traceback):
         sys.__excepthook__(exc_type, exc_value, exc_traceback)
         return
     logging.critical("Uncaught exception!", exc_info=(exc_type, exc_value, exc_traceback))
+    # Send the error before the process exits
+    flush_log_handlers()
 
 sys.excepthook = handle_exception
 
 class Project:
 
-    def __init__(self, config, repo, bot, secrets, parent_directory, cli_args):
+    def __init__(self, config, repo, bot, secrets, parent_directory, cli_args, journal, github_data):
         self.config = config
         self.repo = repo
+        self.journal = journal
+        self.github_data = github_data
         self.name = repo.name
         self.bot = bot
         self.secrets = secrets
         self.parent_directory = parent_directory
         self.cli_args = cli_args
         self.directory = os.path.join(parent_directory, self.name)
-        self.start_time = timer()
+        self.cache_directory = os.path.join(PROJECT_CACHE_DIRECTORY, self.name)
+        self.shared_cache_directory = CACHE_DIRECTORY
+        self.crowdin = None
 
-    def display_elapsed_time(self):
-        display_elapsed_time(self.start_time)
-        self.start_time = timer()
+    def run_task(self, task, function):
+        """Run the given task function, measuring it as a span, and record it in the run journal."""
+        with span("task", task, task=task):
+            function(self)
+        self.journal.record(get_unit_name(self.name, task), get_task_input_hash(self.config, self.github_data))
 
     def clone(self):
-        """Clone the repository, deleting any existing installations."""
-        if not self.cli_args.skip_clone:
-            if os.path.isdir(self.directory):
-                logging.info("Existing repository detected! Deleting existing directory...")
-                run_shell(["sudo", "rm", "-r", self.directory])
-            run_shell(["git", "clone", self.repo.ssh_url])
-
-    def run(self):
-        if self.cli_args.task in TASK_KEYWORDS["link-checker"] and self.config.get("broken-link-checker"):
-            check_links(self)
-            self.display_elapsed_time()
-
-        if self.config.get("translation"):
+        """Update the local clone of the repository.
+
+        New objects are fetched into a persistent bare mirror, and the clone
+        copies objects from the mirror so they are only downloaded once. The
+        clone is dissociated from the mirror, so it keeps working if the
+        mirror is deleted. An existing clone is fetched and reset in place,
+        and is recreated if it is corrupted, shallow, or borrows objects
+        from another repository.
+        """
+        if self.cli_args.skip_clone:
+            return
+        if self.cli_args.shallow_clone:
+            logging.info("Creating shallow clone of repository...")
+            remove_directory(self.directory)
+            run_shell(["git", "clone", "--depth", "1", "--no-single-branch", self.repo.ssh_url, self.directory])
+            return
+
+        mirror_path = os.path.join(MIRROR_DIRECTORY, self.name + ".git")
+        update_mirror(self.repo.ssh_url, mirror_path)
+        if is_git_directory(self.directory) and is_shallow_clone(self.directory):
+            # Left by a previous --shallow-clone run, tasks need the full history
+            logging.info("Existing repository is a shallow clone, deleting existing directory...")
+        elif is_git_directory(self.directory) and has_alternates(self.directory):
+            # Left by a previous run without --dissociate, and breaks if the mirror is deleted
+            logging.info("Existing repository depends on a mirror, deleting existing directory...")
+        elif is_git_directory(self.directory):
+            try:
+                reset_working_copy(self.directory, self.repo.default_branch)
+                return
+            except subprocess.CalledProcessError:
+                logging.warning("Existing repository could not be reset, deleting existing directory...")
+        elif os.path.exists(self.directory):
+            logging.info("Existing directory is not a valid repository, deleting existing directory...")
+        remove_directory(self.directory)
+        run_shell(["git", "clone", "--reference", mirror_path, "--dissociate", self.repo.ssh_url, self.directory])
+
+    def setup_git_account(self):
+        """Set the name and email of the git account for this repository only."""
+        self.git.run(["config", "user.name", GITHUB_BOT_NAME])
+        self.git.run(["config", "user.email", GITHUB_BOT_EMAIL])
+
+    def run(self, requested_tasks=None):
+        """Run the requested tasks, in the order set by the task graph.
+
+        The Crowdin client is created for the first task that uses it, and
+        kept until the project is closed.
+
+        Args:
+            requested_tasks: (list of str) Tasks to run, instead of the
+                task requested on the command line.
+
+        Raises:
+            RuntimeError if any task failed.
+        """
+        if requested_tasks is None:
+            requested_tasks = get_requested_tasks(self.cli_args.task)
+        tasks = get_pending_tasks(self.name, self.config, self.github_data, requested_tasks, self.journal)
+        task_functions = {task: get_task_function(task) for task in tasks}
+        self.head_commit = self.git.run(["rev-parse", "HEAD"]).stdout.decode("utf-8").strip()
+        uses_crowdin = any(TASK_GRAPH[task]["config-key"] == "translation" for task in tasks)
+        if uses_crowdin and self.crowdin is None:
+            from translation import create_crowdin_client
             self.crowdin_api_key = get_crowdin_api_key(self.name, self.secrets)
-            if self.cli_args.task in TASK_KEYWORDS["update-source-message-files"]:
-                update_source_message_file(self)
-                self.display_elapsed_time()
-            if self.cli_args.task in TASK_KEYWORDS["push-source-files"]:
-                push_source_files(self)
-                self.display_elapsed_time()
-            if self.cli_args.task in TASK_KEYWORDS["build-project"]:
-                build_project(self)
-                self.display_elapsed_time()
-            if self.cli_args.task in TASK_KEYWORDS["pull-translations"]:
-                pull_translations(self)
-                self.display_elapsed_time()
+            self.crowdin = create_crowdin_client(self)
+        outcomes = run_task_graph(
+            tasks,
+            {task: TASK_GRAPH[task]["dependencies"] for task in tasks},
+            lambda task: self.run_task(task, task_functions[task]),
+        )
+        failed_tasks = [task for task in tasks if outcomes[task] == FAILED]
+        if failed_tasks:
+            raise RuntimeError("Tasks failed: {}".format(", ".join(failed_tasks)))
 
+    def close(self):
+        if self.crowdin is not None:
+            self.crowdin.close()
+            self.crowdin = None
 
-def main():
+
+def run_project(config, repo, bot, secrets, parent_directory, cli_args, journal, github_data):
+    """Clone and run the requested tasks for a single repository."""
+    project = Project(config, repo, bot, secrets, parent_directory, cli_args, journal, github_data)
+    try:
+        run_project_tasks(project)
+    finally:
+        project.close()
+
+
+def run_project_tasks(project, requested_tasks=None):
+    """Clone a project's repository, and run its tasks.
+
+    Args:
+        project: (Project) Project to run.
+        requested_tasks: (list of str) Tasks to run, instead of the task
+            requested on the command line.
+    """
+    set_base_labels(repo=project.name)
+    with span("repo", project.repo.full_name):
+        with span("task", "clone", task="clone"):
+            project.clone()
+        project.git = GitRepository(project.directory)
+        try:
+            project.setup_git_account()
+            project.run(requested_tasks)
+        finally:
+            project.git.close()
+
+
+def run_project_worker(config, repo_full_name, secrets, parent_directory, cli_args, journal, github_data):
+    """Run a single repository inside a worker process.
+
+    Each worker process has its own logging setup and GitHub client, so
+    repositories never share state. Exceptions are caught and reported
+    back to the parent process rather than raised.
+
+    Returns:
+        Tuple of (repository name, success boolean, error message, seconds
+        taken, list of spans recorded).
+    """
     start_time = timer()
+    setup_logging(cli_args, repo_name=repo_full_name)
+    try:
+        import github
+        github_env = github.Github(secrets["GITHUB_TOKEN"])
+        with span("github", "get_repo"):
+            repo = github_env.get_repo(repo_full_name)
+        with span("github", "get_user"):
+            bot = github_env.get_user(GITHUB_BOT_USERNAME)
+        run_project(config, repo, bot, secrets, parent_directory, cli_args, journal, github_data)
+    except Exception as e:
+        logging.exception("Error while processing repository.")
+        error = "{}: {}".format(type(e).__name__, e)
+        return (repo_full_name, False, error, timer() - start_time, get_recorded_spans())
+    finally:
+        # Pool workers may be terminated without running exit handlers
+        flush_log_handlers()
+    return (repo_full_name, True, None, timer() - start_time, get_recorded_spans())
+
+
+def get_task_function(task):
+    """Import the module of a task, and return the function that runs it."""
+    task_data = TASK_GRAPH[task]
+    return getattr(importlib.import_module(task_data["module"]), task_data["function"])
+
+
+def get_requested_tasks(task):
+    """Return the tasks to run for the task requested on the command line."""
+    if task == ALL_TASKS_KEYWORD:
+        return list(TASK_GRAPH)
+    return [task]
+
+
+def get_task_input_hash(config, github_data):
+    """Return a hash of the inputs of a repository's tasks: its config and default branch commit."""
+    return get_input_hash(config, github_data["head"])
+
+
+def get_pending_tasks(name, config, github_data, requested_tasks, journal):
+    """Return the requested tasks enabled by a repository's config that the run journal has not completed."""
+    input_hash = get_task_input_hash(config, github_data)
+    return [
+        requested_task for requested_task in requested_tasks
+        if config.get(TASK_GRAPH[requested_task]["config-key"])
+        and not journal.is_complete(get_unit_name(name, requested_task), input_hash)
+    ]
+
+
+def select_projects(config_index, github_index, task, journal):
+    """Return the repositories that have work to do for the given task.
+
+    Args:
+        config_index: (dict) Config index, as updated by update_config_index.
+        github_index: (dict) Repository data read at the start of the run.
+        task: (str) Task requested on the command line.
+        journal: (RunJournal) Journal of the units completed by this run,
+            and by the run it resumes.
+
+    Returns:
+        List of (config, repository full name, repository data) tuples.
+    """
+    projects = []
+    for (name, github_data) in sorted(github_index.items()):
+        entry = config_index[name]
+        if entry["config"] is None:
+            continue
+        if not set(get_requested_tasks(task)) & set(entry["tasks"]):
+            logging.info("Skipping {}, as its Arnold config has no '{}' task.".format(name, task))
+        elif not get_pending_tasks(name, entry["config"], github_data, get_requested_tasks(task), journal):
+            logging.info("Skipping {}, as the previous run completed its '{}' task.".format(name, task))
+        else:
+            projects.append((entry["config"], github_data["full_name"], github_data))
+    logging.info("{} of {} repositories have work for the '{}' task.".format(len(projects), len(github_index), task))
+    return projects
+
+
+def display_plan(projects, task, journal):
+    """Log the repositories and tasks that would be run."""
+    logging.info("{0}\nPlan\n{1}".format(MAJOR_SEPERATOR, MINOR_SEPERATOR))
+    for (config, repo_full_name, github_data) in projects:
+        name = repo_full_name.split("/")[-1]
+        tasks = get_pending_tasks(name, config, github_data, get_requested_tasks(task), journal)
+        logging.info("  - {}: {}".format(repo_full_name, ", ".join(tasks)))
+
+
+def setup_logging(cli_args, repo_name=None):
+    """Log to the console, and to Cloud Logging unless only planning a run.
+
+    Args:
+        repo_name: (str) Name of the repository processed by this worker
+            process, which labels every record, and prefixes console messages.
+    """
+    root_logger = logging.getLogger()
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(RepositoryLogFormatter())
+    handlers = [console_handler]
+    if not cli_args.dry_run:
+        handlers.append(AsyncCloudLoggingHandler())
+    for handler in handlers:
+        if repo_name:
+            handler.addFilter(RepositoryLogFilter(repo_name))
+        root_logger.addHandler(handler)
+
+
+def display_summary(results):
+    """Log the outcome of each repository that was processed."""
+    logging.info("{0}\nSummary\n{1}".format(MAJOR_SEPERATOR, MINOR_SEPERATOR))
+    for (repo_name, success, error, elapsed) in results:
+        mins, secs = divmod(elapsed, 60)
+        status = "Success" if success else "Failed ({})".format(error)
+        logging.info("  - {}: {} [{:.0f}m {:.1f}s]".format(repo_name, status, mins, secs))
+    failures = sum(1 for result in results if not result[1])
+    logging.info("{} repositor{} processed, {} failed.".format(
+        len(results),
+        "y" if len(results) == 1 else "ies",
+        failures,
+    ))
+
+
+def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "task",
-        help="The task to run"
+        help="The task to run",
+        choices=list(TASK_GRAPH) + [ALL_TASKS_KEYWORD, SERVE_KEYWORD],
     )
     parser.add_argument(
         "-c",
@@ -122,13 +391,97 @@ def main():
         help="Skip cloning repositories",
         action="store_true"
     )
+    parser.add_argument(
+        "-s",
+        "--shallow-clone",
+        help="Clone repositories without history or the mirror cache (for tasks that don't need history)",
+        action="store_true"
+    )
     parser.add_argument(
         "-r",
         "--repo",
         help="Run only on the given repository",
         action="store"
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of repositories to process concurrently (default: 1)",
+        action="store",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="Show the repositories and tasks that would be run, without running them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip work completed by the previous run, if its inputs are unchanged",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--language",
+        help="Crowdin language code to pull translations for, can be repeated (default: all)",
+        action="append",
+        dest="languages",
+    )
+    parser.add_argument(
+        "--port",
+        help="Port to receive webhook events on when serving (default: {})".format(DEFAULT_PORT),
+        action="store",
+        type=int,
+        default=DEFAULT_PORT,
+    )
+    parser.add_argument(
+        "--debounce",
+        help="Seconds without events for a repository before its job runs when serving (default: {})".format(
+            DEFAULT_DEBOUNCE,
+        ),
+        action="store",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+    )
+    parser.add_argument(
+        "--metrics-directory",
+        help="Directory to write the metrics report to (default: {})".format(METRICS_DIRECTORY),
+        action="store",
+        default=METRICS_DIRECTORY,
+    )
+    parser.add_argument(
+        "--docker-cache-size",
+        help="Gigabytes of Docker images to keep between runs (default: {})".format(DEFAULT_DOCKER_CACHE_SIZE),
+        action="store",
+        type=float,
+        default=DEFAULT_DOCKER_CACHE_SIZE,
+    )
     args = parser.parse_args()
+    setup_logging(args)
+    if args.task == SERVE_KEYWORD:
+        serve(args)
+        return
+    if args.dry_run:
+        run_repositories(args)
+        return
+    try:
+        with span("run", args.task):
+            results = run_repositories(args)
+    finally:
+        write_report(args.metrics_directory)
+    # Exit with an error if any repository failed, for cron and monitoring
+    if not all(success for (repo_name, success, error, elapsed) in results):
+        sys.exit(1)
+
+
+def run_repositories(args):
+    """Run the requested task on all repositories with an Arnold config.
+
+    Returns:
+        List of (repository name, success boolean, error message, seconds
+        taken) tuples, which is empty for a dry run.
+    """
     if args.skip_clone:
         logging.info("Skip cloning repositories turned on.\n")
 
@@ -136,47 +489,189 @@ def main():
 
     if not os.path.exists(PROJECT_DIRECTORY):
         os.makedirs(PROJECT_DIRECTORY)
-    os.chdir(PROJECT_DIRECTORY)
-    directory_of_projects = os.path.abspath(os.getcwd())
-
-    github_env = github.Github(secrets["GITHUB_TOKEN"])
-    uccser = github_env.get_user("uccser")
-    bot = github_env.get_user("uccser-bot")
-    if args.repo:
-        uccser_repos = [uccser.get_repo(args.repo)]
+    directory_of_projects = os.path.abspath(PROJECT_DIRECTORY)
+
+    github_client = GitHubClient(secrets["GITHUB_TOKEN"])
+    try:
+        github_index = load_repository_index(
+            github_client,
+            GITHUB_ORGANISATION,
+            GITHUB_BOT_USERNAME,
+            repository_name=args.repo,
+        )
+        config_index = load_config_index(CACHE_DIRECTORY)
+        update_config_index(
+            config_index,
+            github_index,
+            lambda names: load_file_texts(github_client, GITHUB_ORGANISATION, PROJECT_CONFIG_FILE, names),
+            TASK_CONFIG_KEYS,
+            complete=not args.repo,
+        )
+        save_config_index(CACHE_DIRECTORY, config_index)
+    finally:
+        github_client.close()
+    journal = RunJournal(CACHE_DIRECTORY, resume=args.resume)
+    projects = select_projects(config_index, github_index, args.task, journal)
+    if args.dry_run:
+        display_plan(projects, args.task, journal)
+        return []
+    if not args.resume:
+        journal.clear()
+
+    results = []
+    if args.jobs > 1:
+        logging.info("Processing {} repositories with {} workers.".format(len(projects), args.jobs))
+        # Spawn fresh processes so no logging or network state is shared,
+        # and use one process per repository for clean module state.
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes=args.jobs, maxtasksperchild=1) as pool:
+            worker_results = pool.starmap(
+                run_project_worker,
+                [
+                    (config, repo_full_name, secrets, directory_of_projects, args, journal, github_data)
+                    for (config, repo_full_name, github_data) in projects
+                ],
+                chunksize=1,
+            )
+        for worker_result in worker_results:
+            add_recorded_spans(worker_result[4])
+            results.append(worker_result[:4])
     else:
-        uccser_repos = uccser.get_repos()
+        import github
+        github_env = github.Github(secrets["GITHUB_TOKEN"])
+        with span("github", "get_user"):
+            bot = github_env.get_user(GITHUB_BOT_USERNAME)
+        for (config, repo_full_name, github_data) in projects:
+            logging.info("{0}\n{1}\n{2}".format(MAJOR_SEPERATOR, repo_full_name, MINOR_SEPERATOR))
+            project_start_time = timer()
+            # A failure in one repository doesn't stop the others
+            try:
+                with span("github", "get_repo"):
+                    repo = github_env.get_repo(repo_full_name)
+                run_project(config, repo, bot, secrets, directory_of_projects, args, journal, github_data)
+            except Exception as e:
+                logging.exception("Error while processing repository.")
+                error = "{}: {}".format(type(e).__name__, e)
+                results.append((repo_full_name, False, error, timer() - project_start_time))
+            else:
+                results.append((repo_full_name, True, None, timer() - project_start_time))
+            logging.info("{0}\n".format(MAJOR_SEPERATOR))
+    display_summary(results)
+    return results
 
-    for repo in uccser_repos:
-        os.chdir(directory_of_projects)
-        logging.info("{0}\n{1}\n{2}".format(MAJOR_SEPERATOR, repo.full_name, MINOR_SEPERATOR))
-        try:
-            config_file = repo.get_contents(PROJECT_CONFIG_FILE)
-            logging.info("Config file for Arnold detected.")
-        except github.GithubException:
-            config_file = None
-            logging.info("Config file for Arnold not detected.")
-        if config_file:
-            logging.info("Reading Arnold config.")
+
+class WebhookService:
+    """Runs the tasks affected by webhook events, keeping state between jobs.
+
+    The GitHub clients, and each project with its Crowdin session, are
+    kept between jobs, as are the clones, mirrors and caches on disk.
+    """
+
+    def __init__(self, cli_args, secrets, parent_directory):
+        import github
+        self.cli_args = cli_args
+        self.secrets = secrets
+        self.parent_directory = parent_directory
+        self.journal = RunJournal(CACHE_DIRECTORY, filename=SERVICE_JOURNAL_FILENAME)
+        self.journal.clear()
+        self.github_client = GitHubClient(secrets["GITHUB_TOKEN"])
+        self.github_env = github.Github(secrets["GITHUB_TOKEN"])
+        with span("github", "get_user"):
+            self.bot = self.github_env.get_user(GITHUB_BOT_USERNAME)
+        self.config_index = load_config_index(CACHE_DIRECTORY)
+        self.projects = dict()
+
+    def run_job(self, job):
+        """Run the tasks affected by a job's events on its repository."""
+        from daemon import get_job_tasks
+        name = job.repository
+        github_index = load_repository_index(
+            self.github_client,
+            GITHUB_ORGANISATION,
+            GITHUB_BOT_USERNAME,
+            repository_name=name,
+        )
+        if not github_index.get(name):
+            return
+        update_config_index(
+            self.config_index,
+            github_index,
+            lambda names: load_file_texts(self.github_client, GITHUB_ORGANISATION, PROJECT_CONFIG_FILE, names),
+            TASK_CONFIG_KEYS,
+            complete=False,
+        )
+        save_config_index(CACHE_DIRECTORY, self.config_index)
+        config = self.config_index[name]["config"]
+        if config is None:
+            logging.info("Skipping {}, as it has no Arnold config.".format(name))
+            return
+        project = self.projects.get(name)
+        if project is None:
+            with span("github", "get_repo"):
+                repo = self.github_env.get_repo(github_index[name]["full_name"])
+            project = Project(
+                config,
+                repo,
+                self.bot,
+                self.secrets,
+                self.parent_directory,
+                self.cli_args,
+                self.journal,
+                github_index[name],
+            )
+            self.projects[name] = project
+        project.config = config
+        project.github_data = github_index[name]
+        tasks = get_job_tasks(job, config, project.repo.default_branch)
+        if not tasks:
+            logging.info("Skipping {}, as no tasks are affected by its {} events.".format(name, job.event_count))
+            return
+        # Only pull translations for the languages with new translations
+        project.cli_args = argparse.Namespace(**vars(self.cli_args))
+        project.cli_args.languages = sorted(job.languages) or None
+        logging.info("{0}\n{1}: {2}\n{3}".format(MAJOR_SEPERATOR, name, ", ".join(sorted(tasks)), MINOR_SEPERATOR))
+        run_project_tasks(project, [task for task in TASK_GRAPH if task in tasks])
+
+    def close(self):
+        for project in self.projects.values():
+            project.close()
+        self.github_client.close()
+
+
+def serve(args):
+    """Receive webhook events, and run the tasks they affect until interrupted."""
+    from daemon import JobQueue, WebhookServer
+    secrets = read_secrets(REQUIRED_SECRETS + WEBHOOK_SECRETS)
+    if not os.path.exists(PROJECT_DIRECTORY):
+        os.makedirs(PROJECT_DIRECTORY)
+    service = WebhookService(args, secrets, os.path.abspath(PROJECT_DIRECTORY))
+    job_queue = JobQueue(debounce=args.debounce)
+    server = WebhookServer(
+        ("", args.port),
+        job_queue,
+        github_secret=secrets["GITHUB_WEBHOOK_SECRET"],
+        crowdin_token=secrets["CROWDIN_WEBHOOK_TOKEN"],
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("Receiving webhook events on port {}.".format(server.server_port))
+    try:
+        while True:
+            job = job_queue.get()
+            # A failed job doesn't stop the service
             try:
-                config = yaml.load(base64.b64decode(config_file.content).decode("utf-8"))
-            except yaml.YAMLError:
-                logging.error("Error! YAML file invalid.")
-                # TODO: Log issue on repo
-            if config:
-                project = Project(config, repo, bot, secrets, directory_of_projects, args)
-                project.clone()
-                os.chdir(project.directory)
-                setup_git_account()
-                project.run()
-        logging.info("{0}\n".format(MAJOR_SEPERATOR))
-    display_elapsed_time(start_time)
-
-
-def setup_git_account():
-    """Set the name and email account of the git account."""
-    run_shell(["git", "config", "--global", "user.name", GITHUB_BOT_NAME])
-    run_shell(["git", "config", "--global", "user.email", GITHUB_BOT_EMAIL])
+                with span("job", job.repository):
+                    service.run_job(job)
+            except Exception:
+                logging.exception("Error while running job for {}.".format(job.repository))
+            write_report(args.metrics_directory)
+            clear_recorded_spans()
+    except KeyboardInterrupt:
+        logging.info("Stopping webhook service.")
+    finally:
+        server.shutdown()
+        server.server_close()
+        job_queue.stop()
+        service.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+from utils.config_index import load_config_index, save_config_index, update_config_index, get_index_path
+
+TASK_CONFIG_KEYS = {
+    "link-checker": "broken-link-checker",
+    "pull-translations": "translation",
+}
+CONFIG_TEXT = "broken-link-checker:\n  starting-points:\n    - docs/\n"
+
+
+def get_repository_index(**heads):
+    return {name: {"head": head, "pushed_at": "2020-01-01T00:00:00Z"} for (name, head) in heads.items()}
+
+
+class ConfigReader:
+    """Returns the same config text for every repository, recording the names read."""
+
+    def __init__(self, config_text=CONFIG_TEXT):
+        self.config_text = config_text
+        self.names_read = []
+
+    def __call__(self, names):
+        self.names_read.extend(names)
+        return {name: self.config_text for name in names}
+
+
+def test_new_repositories_are_read():
+    config_index = dict()
+    reader = ConfigReader()
+    changed_names = update_config_index(config_index, get_repository_index(b="1", a="1"), reader, TASK_CONFIG_KEYS)
+    assert sorted(changed_names) == ["a", "b"]
+    assert reader.names_read == ["a", "b"]
+    assert config_index["a"]["tasks"] == ["link-checker"]
+    assert config_index["a"]["config"] == {"broken-link-checker": {"starting-points": ["docs/"]}}
+
+
+def test_only_changed_repositories_are_read_again():
+    config_index = dict()
+    update_config_index(config_index, get_repository_index(a="1", b="1"), ConfigReader(), TASK_CONFIG_KEYS)
+    reader = ConfigReader()
+    assert update_config_index(config_index, get_repository_index(a="1", b="2"), reader, TASK_CONFIG_KEYS) == ["b"]
+    assert reader.names_read == ["b"]
+    assert config_index["b"]["head"] == "2"
+
+
+def test_new_push_invalidates_entry():
+    config_index = dict()
+    update_config_index(config_index, get_repository_index(a="1"), ConfigReader(), TASK_CONFIG_KEYS)
+    repository_index = get_repository_index(a="1")
+    repository_index["a"]["pushed_at"] = "2020-02-01T00:00:00Z"
+    assert update_config_index(config_index, repository_index, ConfigReader(), TASK_CONFIG_KEYS) == ["a"]
+
+
+def test_missing_repositories_are_removed_only_from_complete_index():
+    config_index = dict()
+    update_config_index(config_index, get_repository_index(a="1", b="1"), ConfigReader(), TASK_CONFIG_KEYS)
+    update_config_index(config_index, get_repository_index(a="1"), ConfigReader(), TASK_CONFIG_KEYS, complete=False)
+    assert sorted(config_index) == ["a", "b"]
+    update_config_index(config_index, get_repository_index(a="1"), ConfigReader(), TASK_CONFIG_KEYS)
+    assert sorted(config_index) == ["a"]
+
+
+def test_invalid_config_enables_no_tasks():
+    config_index = dict()
+    update_config_index(config_index, get_repository_index(a="1"), ConfigReader("- not a mapping"), TASK_CONFIG_KEYS)
+    assert config_index["a"]["config"] is None
+    assert config_index["a"]["tasks"] == []
+
+
+def test_saved_index_is_loaded(tmp_path):
+    config_index = dict()
+    update_config_index(config_index, get_repository_index(a="1"), ConfigReader(), TASK_CONFIG_KEYS)
+    save_config_index(str(tmp_path), config_index)
+    assert load_config_index(str(tmp_path)) == config_index
+
+
+def test_missing_or_invalid_index_loads_empty(tmp_path):
+    assert load_config_index(str(tmp_path)) == dict()
+    with open(get_index_path(str(tmp_path)), "w") as f:
+        f.write("{not json")
+    assert load_config_index(str(tmp_path)) == dict()
@@ -0,0 +1,84 @@
+import time
+import threading
+from daemon.jobs import Job, JobQueue
+
+# Seconds allowed for a job to be returned after it is due
+TOLERANCE = 0.5
+
+
+def test_events_for_a_repository_are_coalesced():
+    job_queue = JobQueue(debounce=0.1)
+    job_queue.add_push("cs-unplugged", "develop", ["csunplugged/topics/a.md"])
+    job_queue.add_push("cs-unplugged", "develop", ["csunplugged/topics/b.md"])
+    job_queue.add_translation("cs-unplugged", "de")
+    job = job_queue.get()
+    assert job.repository == "cs-unplugged"
+    assert job.event_count == 3
+    assert job.changed_paths == {"develop": {"csunplugged/topics/a.md", "csunplugged/topics/b.md"}}
+    assert job.languages == {"de"}
+    assert job_queue.jobs == dict()
+
+
+def test_unknown_paths_are_kept_unknown():
+    job = Job("cs-unplugged")
+    job.add_push("develop", ["a.md"])
+    job.add_push("develop", None)
+    job.add_push("develop", ["b.md"])
+    assert job.changed_paths == {"develop": None}
+
+
+def test_job_is_due_after_debounce():
+    job_queue = JobQueue(debounce=0.3, max_delay=10)
+    start_time = time.monotonic()
+    job_queue.add_push("cs-unplugged", "develop", ["a.md"])
+    job = job_queue.get()
+    elapsed = time.monotonic() - start_time
+    assert job.repository == "cs-unplugged"
+    assert 0.3 <= elapsed < 0.3 + TOLERANCE
+
+
+def test_new_events_delay_job():
+    job_queue = JobQueue(debounce=0.3, max_delay=10)
+    start_time = time.monotonic()
+    job_queue.add_push("cs-unplugged", "develop", ["a.md"])
+    threading.Timer(0.2, job_queue.add_push, ("cs-unplugged", "develop", ["b.md"])).start()
+    job = job_queue.get()
+    elapsed = time.monotonic() - start_time
+    assert job.event_count == 2
+    assert 0.5 <= elapsed < 0.5 + TOLERANCE
+
+
+def test_job_is_due_after_max_delay_despite_new_events():
+    job_queue = JobQueue(debounce=0.3, max_delay=0.6)
+    stop = threading.Event()
+
+    def add_events():
+        while not stop.wait(0.1):
+            job_queue.add_push("cs-unplugged", "develop", ["a.md"])
+
+    start_time = time.monotonic()
+    job_queue.add_push("cs-unplugged", "develop", ["a.md"])
+    thread = threading.Thread(target=add_events)
+    thread.start()
+    try:
+        job = job_queue.get()
+    finally:
+        stop.set()
+        thread.join()
+    elapsed = time.monotonic() - start_time
+    assert job.event_count > 1
+    assert 0.6 <= elapsed < 0.6 + TOLERANCE
+
+
+def test_earliest_due_job_is_returned_first():
+    job_queue = JobQueue(debounce=0.1)
+    job_queue.add_push("cs-unplugged", "develop", ["a.md"])
+    job_queue.jobs["cs-unplugged"].last_event_time += 10
+    job_queue.add_push("cs-field-guide", "develop", ["b.md"])
+    assert job_queue.get().repository == "cs-field-guide"
+
+
+def test_stop_releases_waiting_get():
+    job_queue = JobQueue()
+    threading.Timer(0.1, job_queue.stop).start()
+    assert job_queue.get() is None
@@ -0,0 +1,51 @@
+import time
+from link_checker.link_cache import (
+    get_result_ttl,
+    is_expired,
+    load_url_cache,
+    save_url_cache,
+    WORKING_LINK_TTL,
+    MISSING_LINK_TTL,
+    CLIENT_ERROR_TTL,
+    SERVER_ERROR_TTL,
+)
+
+
+def test_result_ttl_depends_on_status():
+    assert get_result_ttl(200) == WORKING_LINK_TTL
+    assert get_result_ttl(301) == WORKING_LINK_TTL
+    assert get_result_ttl(404) == MISSING_LINK_TTL
+    assert get_result_ttl(410) == MISSING_LINK_TTL
+    assert get_result_ttl(403) == CLIENT_ERROR_TTL
+    assert get_result_ttl(429) == CLIENT_ERROR_TTL
+    assert get_result_ttl(500) == SERVER_ERROR_TTL
+    assert get_result_ttl(503) == SERVER_ERROR_TTL
+    assert get_result_ttl("ConnectionError") == SERVER_ERROR_TTL
+
+
+def test_broken_links_expire_before_working_links():
+    assert SERVER_ERROR_TTL < CLIENT_ERROR_TTL < MISSING_LINK_TTL < WORKING_LINK_TTL
+
+
+def test_is_expired():
+    now = 1000000
+    assert not is_expired({"status": 200, "checked_at": now - WORKING_LINK_TTL}, now)
+    assert is_expired({"status": 200, "checked_at": now - WORKING_LINK_TTL - 1}, now)
+    assert is_expired({"status": 500, "checked_at": now - SERVER_ERROR_TTL - 1}, now)
+
+
+def test_expired_results_are_not_loaded(tmp_path):
+    now = time.time()
+    save_url_cache(str(tmp_path), {
+        "https://example.com/working": {"status": 200, "broken": False, "checked_at": now - MISSING_LINK_TTL - 1},
+        "https://example.com/missing": {"status": 404, "broken": True, "checked_at": now - MISSING_LINK_TTL - 1},
+        "https://example.com/error": {"status": 500, "broken": True, "checked_at": now},
+    })
+    assert sorted(load_url_cache(str(tmp_path))) == ["https://example.com/error", "https://example.com/working"]
+
+
+def test_saved_results_are_merged(tmp_path):
+    now = time.time()
+    save_url_cache(str(tmp_path), {"https://example.com/a": {"status": 200, "broken": False, "checked_at": now}})
+    save_url_cache(str(tmp_path), {"https://example.com/b": {"status": 200, "broken": False, "checked_at": now}})
+    assert sorted(load_url_cache(str(tmp_path))) == ["https://example.com/a", "https://example.com/b"]
@@ -0,0 +1,77 @@
+from translation.message_files import parse_message_file, has_trivial_changes_only
+
+HEADER = '''msgid ""
+msgstr ""
+"Project-Id-Version: \\n"
+"POT-Creation-Date: {created}\\n"
+"PO-Revision-Date: {revised}\\n"
+"Content-Type: text/plain; charset=UTF-8\\n"
+'''
+
+ENTRIES = '''
+#: templates/home.html:{line}
+msgid "Hello"
+msgstr "Kia ora"
+
+#: templates/home.html:20
+#, python-format
+msgid "%(count)s topics"
+msgstr ""
+"%(count)s "
+"kaupapa"
+'''
+
+
+def make_message_file(created="2019-01-01 10:00+1300", revised="2019-01-01 10:00+1300", line=10, entries=ENTRIES):
+    return HEADER.format(created=created, revised=revised) + entries.format(line=line)
+
+
+def test_parse_message_file_joins_and_unescapes_strings():
+    entries = parse_message_file(make_message_file())
+    assert entries[1] == {
+        "comments": ["#: templates/home.html:10"],
+        "fields": [("msgid", "Hello"), ("msgstr", "Kia ora")],
+    }
+    assert entries[2]["comments"] == ["#: templates/home.html:20", "#, python-format"]
+    assert entries[2]["fields"] == [("msgid", "%(count)s topics"), ("msgstr", "%(count)s kaupapa")]
+    assert "Content-Type: text/plain; charset=UTF-8\n" in entries[0]["fields"][1][1]
+
+
+def test_header_dates_are_trivial():
+    previous = make_message_file()
+    current = make_message_file(created="2020-06-01 09:00+1200", revised="2020-06-02 09:00+1200")
+    assert has_trivial_changes_only(previous, current)
+
+
+def test_references_are_trivial():
+    assert has_trivial_changes_only(make_message_file(line=10), make_message_file(line=12))
+
+
+def test_unchanged_file_is_trivial():
+    assert has_trivial_changes_only(make_message_file(), make_message_file())
+
+
+def test_changed_translation_is_significant():
+    current = make_message_file().replace('msgstr "Kia ora"', 'msgstr "Tēnā koe"')
+    assert not has_trivial_changes_only(make_message_file(), current)
+
+
+def test_changed_flags_are_significant():
+    current = make_message_file().replace("#, python-format\n", "#, fuzzy, python-format\n")
+    assert not has_trivial_changes_only(make_message_file(), current)
+
+
+def test_other_header_fields_are_significant():
+    current = make_message_file().replace("charset=UTF-8", "charset=ASCII")
+    assert not has_trivial_changes_only(make_message_file(), current)
+
+
+def test_reordered_entries_are_significant():
+    (first_entry, second_entry) = ENTRIES.strip().split("\n\n")
+    reordered = "\n" + second_entry + "\n\n" + first_entry + "\n"
+    assert not has_trivial_changes_only(make_message_file(), make_message_file(entries=reordered))
+
+
+def test_duplicated_entry_is_significant():
+    duplicated = ENTRIES + ENTRIES.split("\n\n")[0] + "\n"
+    assert not has_trivial_changes_only(make_message_file(), make_message_file(entries=duplicated))
@@ -0,0 +1,52 @@
+import threading
+import pytest
+from utils.task_graph import run_task_graph, SUCCEEDED, FAILED, SKIPPED
+
+
+def run_tasks(tasks, dependencies, failing_tasks=()):
+    """Run a task graph, returning the outcomes and the order tasks started in."""
+    started = []
+    lock = threading.Lock()
+
+    def run_task(task):
+        with lock:
+            started.append(task)
+        if task in failing_tasks:
+            raise RuntimeError("{} failed".format(task))
+
+    return (run_task_graph(tasks, dependencies, run_task), started)
+
+
+def test_tasks_run_after_their_dependencies():
+    dependencies = {"build": ["push"], "pull": ["build"]}
+    (outcomes, started) = run_tasks(["pull", "build", "push"], dependencies)
+    assert outcomes == {"pull": SUCCEEDED, "build": SUCCEEDED, "push": SUCCEEDED}
+    assert started == ["push", "build", "pull"]
+
+
+def test_failed_task_skips_dependent_tasks_only():
+    dependencies = {"build": ["push"], "pull": ["build"]}
+    (outcomes, started) = run_tasks(["push", "build", "pull", "links"], dependencies, failing_tasks=["push"])
+    assert outcomes == {"push": FAILED, "build": SKIPPED, "pull": SKIPPED, "links": SUCCEEDED}
+    assert sorted(started) == ["links", "push"]
+
+
+def test_dependencies_not_being_run_are_ignored():
+    (outcomes, _) = run_tasks(["pull"], {"pull": ["build"]})
+    assert outcomes == {"pull": SUCCEEDED}
+
+
+def test_independent_tasks_run_concurrently():
+    # Each task waits for the other to start, so they only finish if run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    outcomes = run_task_graph(["links", "messages"], dict(), lambda task: barrier.wait())
+    assert outcomes == {"links": SUCCEEDED, "messages": SUCCEEDED}
+
+
+def test_circular_dependencies_raise_error():
+    with pytest.raises(ValueError, match="circular"):
+        run_tasks(["push", "build", "links"], {"push": ["build"], "build": ["push"]})
+
+
+def test_no_tasks():
+    assert run_task_graph([], dict(), lambda task: None) == dict()
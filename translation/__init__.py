@@ -6,3 +6,4 @@ from .update_source_message_file import update_source_message_file
 from .push_source_files import push_source_files
 from .pull_translations import pull_translations
 from .build_project import build_project
+from .crowdin_api import create_crowdin_client
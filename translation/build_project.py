@@ -1,10 +1,15 @@
 import logging
-from .crowdin_api import API_URL
-from utils import run_shell
+from .crowdin_api import api_call
 
 
 def build_project(project):
+    """Start a build of translations on Crowdin.
+
+    The build runs in the background on Crowdin, and pull_translations
+    waits for it to finish before downloading translations.
+    """
     logging.info("Triggering build of translations for {}...".format(project.name))
-    url = API_URL.format(project=project.name, method="export")
-    url += "?key={key}".format(key=project.crowdin_api_key)
-    run_shell(["curl", url])
+    response = api_call("export", project, json=True, **{"async": 1})
+    response.raise_for_status()
+    status = response.json().get("success", dict()).get("status")
+    logging.info("Build status: {}".format(status))
@@ -1,10 +1,137 @@
 """Module for interacting with the Crowdin API."""
 
+import time
 import logging
 import requests
 import os.path
+from requests.adapters import HTTPAdapter
+from metrics import span
+from utils.retries import (
+    send_with_retries,
+    is_retryable_status,
+    is_rate_limited,
+    is_connection_error,
+    is_connect_error,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_BACKOFF_FACTOR,
+)
 
 API_URL = "https://api.crowdin.com/api/project/{project}/{method}"
+UPLOAD_BATCH_FILES = 20
+UPLOAD_BATCH_BYTES = 10 * 1024 * 1024
+# Seconds to wait to connect, and between bytes received
+DEFAULT_TIMEOUT = (10, 120)
+CONNECTION_POOL_SIZE = 8
+MEGABYTE = 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+DOWNLOAD_REPORT_BYTES = 10 * MEGABYTE
+EXPORT_IN_PROGRESS_STATUS = "in-progress"
+# Seconds between checks of the export status, and to wait for an export
+EXPORT_POLL_INTERVAL = 15
+DEFAULT_EXPORT_TIMEOUT = 60 * 60
+# Methods that change the project, and may have taken effect even if the
+# response was an error or never arrived
+NON_IDEMPOTENT_METHODS = ("add-file", "update-file", "add-directory", "export")
+# Crowdin error code of add-file when a file already exists
+FILE_EXISTS_ERROR_CODE = 5
+
+
+class CrowdinClient:
+    """Client for the Crowdin API, created once per project.
+
+    All requests share a keep-alive session with a connection pool.
+    Requests that fail with a connection error, timeout, rate limit (429)
+    or server error (5xx) are retried with exponential backoff, waiting at
+    least as long as any Retry-After header asks. Requests to methods that
+    change the project are only retried if they never reached Crowdin
+    (failing to connect, or rate limited), so they are never applied twice.
+    """
+
+    def __init__(self, project_name, api_key, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+        """Create a client.
+
+        Args:
+            project_name: (str) Crowdin project identifier.
+            api_key: (str) Crowdin project API key.
+            timeout: (float or tuple) Connect and read timeout in seconds,
+                as accepted by requests.
+            max_retries: (int) Maximum number of retries per request.
+            backoff_factor: (float) Seconds to wait before the first retry,
+                doubled for each following retry.
+        """
+        self.project_name = project_name
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=CONNECTION_POOL_SIZE, pool_maxsize=CONNECTION_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, http_method, method, files=None, stream=False, **params):
+        """Send a request to the given API method, retrying if required.
+
+        Args:
+            http_method: (str) HTTP method, for example "POST".
+            method: (str) API method to call.
+            files: (dict) Files to encode as multipart form data.
+            stream: (bool) True to not download the response body immediately.
+            params: (dict) API call arguments to encode in the url.
+
+        Returns:
+            Response of the final attempt.
+        """
+        url = API_URL.format(project=self.project_name, method=method)
+        params["key"] = self.api_key
+        if method in NON_IDEMPOTENT_METHODS:
+            (is_retryable, is_retryable_error) = (is_rate_limited, is_connect_error)
+        else:
+            (is_retryable, is_retryable_error) = (is_retryable_status, is_connection_error)
+        with span("crowdin", method) as request_span:
+            response = send_with_retries(
+                lambda: self.session.request(
+                    http_method,
+                    url,
+                    params=params,
+                    files=files,
+                    stream=stream,
+                    timeout=self.timeout,
+                ),
+                "Crowdin",
+                method,
+                request_span,
+                max_retries=self.max_retries,
+                backoff_factor=self.backoff_factor,
+                is_retryable=is_retryable,
+                is_retryable_error=is_retryable_error,
+            )
+            if response.request.body:
+                request_span.bytes_sent = len(response.request.body)
+            if not stream:
+                request_span.bytes_received = len(response.content)
+            if response.status_code >= 400:
+                request_span.outcome = "error"
+            return response
+
+    def close(self):
+        self.session.close()
+
+
+def create_crowdin_client(project):
+    """Create a Crowdin client using the project's translation config.
+
+    The timeout and retry settings can be set with the crowdin-timeout
+    and crowdin-max-retries translation config keys.
+    """
+    translation_data = project.config["translation"]
+    return CrowdinClient(
+        project.name,
+        project.crowdin_api_key,
+        timeout=translation_data.get("crowdin-timeout", DEFAULT_TIMEOUT),
+        max_retries=translation_data.get("crowdin-max-retries", DEFAULT_MAX_RETRIES),
+    )
 
 
 def api_call(method, project, files=None, **params):
@@ -16,51 +143,178 @@ def api_call(method, project, files=None, **params):
         params: (dict) API call arguments to encode in the url
 
     Returns:
-        (str) Text content of the response
+        (requests.Response) Response of the API call
     """
-    params["key"] = project.crowdin_api_key
-    response = requests.post(
-        API_URL.format(project=project.name, method=method),
-        files=files,
-        params=params,
-    )
-    return response
+    return project.crowdin.request("POST", method, files=files, **params)
 
 
 # --- API METHODS ---
 
 
-def upload_file_to_crowdin(file_path, project):
+def get_project_tree(project):
+    """Return the paths of all files and directories in the Crowdin project.
+
+    The whole tree is read with a single info request.
+    See https://support.crowdin.com/api/info/
+
+    Returns:
+        Tuple of (set of file paths, set of directory paths), relative to
+        the project root.
+    """
+    response = api_call("info", project, json=True)
+    response.raise_for_status()
+    file_paths = set()
+    directory_paths = set()
+    nodes = [("", node) for node in response.json().get("files", list())]
+    while nodes:
+        (parent_path, node) = nodes.pop()
+        node_path = os.path.join(parent_path, node["name"])
+        if node["node_type"] == "file":
+            file_paths.add(node_path)
+        else:
+            directory_paths.add(node_path)
+            nodes.extend((node_path, child) for child in node.get("files", list()))
+    return (file_paths, directory_paths)
+
+
+def get_export_pattern(file_path):
     export_pattern = file_path.replace("/en/", "/%osx_locale%/")
     if not export_pattern[0] == "/":
         export_pattern = "/" + export_pattern
+    return export_pattern
 
-    files = {
-        "files[{}]".format(file_path): (os.path.basename(file_path), open(file_path, "rb").read()),
-        "export_patterns[{}]".format(file_path): (None, export_pattern),
-    }
-    response = api_call(
-        "add-file",
-        project,
-        files=files,
-        json=True
-    )
-    response_data = response.json()
+
+def batch_files(directory, file_paths, max_files, max_bytes):
+    """Split file paths into batches within the given limits.
+
+    A single file larger than max_bytes is sent in a batch of its own.
+
+    Args:
+        directory: (str) Directory the file paths are relative to.
+
+    Yields:
+        Lists of file paths.
+    """
+    batch = []
+    batch_bytes = 0
+    for file_path in file_paths:
+        file_bytes = os.path.getsize(os.path.join(directory, file_path))
+        if batch and (len(batch) >= max_files or batch_bytes + file_bytes > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(file_path)
+        batch_bytes += file_bytes
+    if batch:
+        yield batch
+
+
+def send_file_batch(method, file_paths, project):
+    """Send a batch of source files to Crowdin in a single request.
+
+    Args:
+        method: (str) Either "add-file" or "update-file".
+        file_paths: (list of str) Paths of the files to send, relative to
+            the project directory.
+
+    Returns:
+        Response of the API call.
+    """
+    files = dict()
+    for file_path in file_paths:
+        with open(os.path.join(project.directory, file_path), "rb") as f:
+            files["files[{}]".format(file_path)] = (os.path.basename(file_path), f.read())
+        files["export_patterns[{}]".format(file_path)] = (None, get_export_pattern(file_path))
+    return api_call(method, project, files=files, json=True)
+
+
+def send_file_batches(method, file_paths, project, max_files, max_bytes):
+    """Send files to Crowdin in batches, returning the outcome of each file.
+
+    Returns:
+        Dictionary mapping each file path to "added", "updated" or "failed".
+    """
+    outcomes = dict()
+    for batch in batch_files(project.directory, file_paths, max_files, max_bytes):
+        outcomes.update(send_files(method, batch, project))
+    return outcomes
+
+
+def send_files(method, file_paths, project):
+    """Send files to Crowdin in a single request, updating any that already exist.
+
+    If add-file fails because a file already exists on Crowdin (error code
+    5), the files are sent again with update-file. If that also fails, as
+    only some of the files exist, each file is sent on its own.
+
+    Returns:
+        Dictionary mapping each file path to "added", "updated" or "failed".
+    """
+    response = send_file_batch(method, file_paths, project)
     if response.status_code == requests.codes.ok:
-        logging.info("{} - File uploaded to Crowdin.".format(file_path))
-    elif response_data.get("error", dict()).get("code") == 5:
-        response = api_call(
-            "update-file",
-            project,
-            files=files,
-            json=True
-        )
+        outcome = "added" if method == "add-file" else "updated"
+        return {file_path: outcome for file_path in file_paths}
+    if method == "add-file" and get_error_code(response) == FILE_EXISTS_ERROR_CODE:
+        logging.info("Files already exist on Crowdin, updating {} file(s) instead...".format(len(file_paths)))
+        response = send_file_batch("update-file", file_paths, project)
         if response.status_code == requests.codes.ok:
-            logging.info("{} - File updated on Crowdin.".format(file_path))
-    else:
-        logging.error(response)
-        logging.error(response.json())
-        response.raise_for_status()
+            return {file_path: "updated" for file_path in file_paths}
+        if len(file_paths) > 1:
+            outcomes = dict()
+            for file_path in file_paths:
+                outcomes.update(send_files("add-file", [file_path], project))
+            return outcomes
+    logging.error("{} request failed: {}".format(method, response.text))
+    return {file_path: "failed" for file_path in file_paths}
+
+
+def get_error_code(response):
+    """Return the code of the error in a Crowdin response, or None."""
+    try:
+        return response.json().get("error", dict()).get("code")
+    except ValueError:
+        return None
+
+
+def upload_files_to_crowdin(file_paths, project, existing_files=None,
+                            max_files=UPLOAD_BATCH_FILES, max_bytes=UPLOAD_BATCH_BYTES):
+    """Add or update source files on Crowdin, with many files per request.
+
+    Files already on Crowdin are sent with update-file requests, and new
+    files with add-file requests. New files that turn out to exist on
+    Crowdin already are sent again with update-file requests.
+
+    Args:
+        file_paths: (list of str) Paths of the files to upload, relative
+            to the project directory.
+        existing_files: (set of str) Paths of files already on Crowdin,
+            fetched from Crowdin if not given.
+        max_files: (int) Maximum number of files per request.
+        max_bytes: (int) Maximum total file size per request.
+
+    Returns:
+        Dictionary mapping each file path to "added", "updated" or "failed".
+    """
+    if existing_files is None:
+        (existing_files, _) = get_project_tree(project)
+    new_files = [file_path for file_path in file_paths if file_path not in existing_files]
+    updated_files = [file_path for file_path in file_paths if file_path in existing_files]
+    outcomes = dict()
+    for (method, method_files) in [("add-file", new_files), ("update-file", updated_files)]:
+        outcomes.update(send_file_batches(method, method_files, project, max_files, max_bytes))
+
+    messages = {
+        "added": "{} - File uploaded to Crowdin.",
+        "updated": "{} - File updated on Crowdin.",
+        "failed": "{} - File could not be uploaded to Crowdin.",
+    }
+    for file_path in file_paths:
+        outcome = outcomes[file_path]
+        if outcome == "failed":
+            logging.error(messages[outcome].format(file_path))
+        else:
+            logging.info(messages[outcome].format(file_path))
+    return outcomes
 
 
 def create_crowdin_directory(directory, project):
@@ -75,13 +329,68 @@ def create_crowdin_directory(directory, project):
         response.raise_for_status()
 
 
+def get_export_status(project):
+    """Return the status of the latest build of translations.
+
+    See https://support.crowdin.com/api/export-status/
+
+    Returns:
+        Dictionary with the status ("finished" or "in-progress") and
+        percentage progress of the build.
+    """
+    response = api_call("export-status", project, json=True)
+    response.raise_for_status()
+    return response.json()
+
+
+def wait_for_export(project, poll_interval=EXPORT_POLL_INTERVAL):
+    """Wait until the latest build of translations is no longer in progress.
+
+    The maximum number of seconds to wait can be set with the
+    build-timeout translation config key.
+
+    Raises:
+        RuntimeError if the build is still in progress after the timeout.
+    """
+    timeout = project.config["translation"].get("build-timeout", DEFAULT_EXPORT_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    with span("crowdin", "wait_for_export"):
+        while True:
+            export_status = get_export_status(project)
+            if export_status.get("status") != EXPORT_IN_PROGRESS_STATUS:
+                logging.info("Build of translations is {}.".format(export_status.get("status")))
+                return
+            if time.monotonic() >= deadline:
+                raise RuntimeError("Build of translations still in progress after {} seconds.".format(timeout))
+            logging.info("Build of translations in progress ({}%), checking again in {}s...".format(
+                export_status.get("progress", 0),
+                poll_interval,
+            ))
+            time.sleep(poll_interval)
+
+
 def download_translations(project, translation_zip):
+    """Download the ZIP of all translations, streaming it to disk in chunks."""
     logging.info("Downloading translations to {}".format(translation_zip))
-    params = {"key": project.crowdin_api_key}
-    response = requests.get(
-        API_URL.format(project=project.name, method="download/all.zip"),
-        params=params,
-    )
-    with open(translation_zip, "wb") as f:
-        f.write(response.content)
-    logging.info("Download complete.")
+    with span("download", "all.zip") as download_span:
+        response = project.crowdin.request("GET", "download/all.zip", stream=True)
+        response.raise_for_status()
+        total_bytes = int(response.headers.get("Content-Length", 0))
+        downloaded_bytes = 0
+        next_report_bytes = DOWNLOAD_REPORT_BYTES
+        with open(translation_zip, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                f.write(chunk)
+                downloaded_bytes += len(chunk)
+                download_span.bytes_received = downloaded_bytes
+                if downloaded_bytes >= next_report_bytes:
+                    if total_bytes:
+                        logging.info("Downloaded {:.1f} of {:.1f} MB...".format(
+                            downloaded_bytes / MEGABYTE,
+                            total_bytes / MEGABYTE,
+                        ))
+                    else:
+                        logging.info("Downloaded {:.1f} MB...".format(downloaded_bytes / MEGABYTE))
+                    next_report_bytes += DOWNLOAD_REPORT_BYTES
+        response.close()
+    logging.info("Download complete ({:.1f} MB).".format(downloaded_bytes / MEGABYTE))
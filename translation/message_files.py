@@ -0,0 +1,101 @@
+"""Parsing and comparison of gettext PO message files."""
+
+import ast
+
+# Header fields that change on every regeneration of a message file
+TRIVIAL_HEADER_FIELDS = (
+    "POT-Creation-Date:",
+    "PO-Revision-Date:",
+)
+REFERENCE_COMMENT_PREFIX = "#:"
+KEYWORDS = (
+    "msgctxt",
+    "msgid_plural",
+    "msgid",
+    "msgstr",
+)
+
+
+def parse_message_file(contents):
+    """Parse the contents of a PO file into a list of entries.
+
+    Each entry is a dictionary with a "comments" list of comment lines and
+    a "fields" list of (keyword, string) tuples in file order, such as
+    ("msgid", "Hello") or ("msgstr[0]", "Kia ora"). Multi-line strings are
+    joined and unescaped.
+
+    Args:
+        contents: (str) Text of the PO file.
+
+    Returns:
+        List of entry dictionaries.
+    """
+    entries = []
+    entry = None
+    for line in contents.splitlines():
+        line = line.strip()
+        if not line:
+            entry = None
+            continue
+        if entry is None or (line.startswith("#") and entry["fields"]):
+            entry = {"comments": [], "fields": []}
+            entries.append(entry)
+        if line.startswith("#"):
+            entry["comments"].append(line)
+        elif line.startswith('"') and entry["fields"]:
+            (keyword, value) = entry["fields"][-1]
+            entry["fields"][-1] = (keyword, value + parse_string(line))
+        else:
+            (keyword, _, value) = line.partition(" ")
+            entry["fields"].append((keyword, parse_string(value.strip())))
+    return entries
+
+
+def parse_string(quoted_string):
+    """Return the value of a quoted PO string, or the raw text if invalid."""
+    try:
+        return ast.literal_eval(quoted_string)
+    except (ValueError, SyntaxError):
+        return quoted_string
+
+
+def get_significant_entries(contents):
+    """Return the entries of a PO file with trivial details removed.
+
+    Source reference comments (#:) are removed from every entry, and the
+    creation and revision dates are removed from the header entry.
+
+    Returns:
+        List of (comments tuple, fields tuple) tuples in file order.
+    """
+    significant_entries = []
+    for entry in parse_message_file(contents):
+        comments = tuple(
+            comment for comment in entry["comments"]
+            if not comment.startswith(REFERENCE_COMMENT_PREFIX)
+        )
+        fields = entry["fields"]
+        if ("msgid", "") in fields:
+            fields = [
+                (keyword, remove_trivial_header_fields(value)) if keyword == "msgstr" else (keyword, value)
+                for (keyword, value) in fields
+            ]
+        significant_entries.append((comments, tuple(fields)))
+    return significant_entries
+
+
+def remove_trivial_header_fields(header):
+    return "\n".join(
+        line for line in header.split("\n")
+        if not line.startswith(TRIVIAL_HEADER_FIELDS)
+    )
+
+
+def has_trivial_changes_only(previous, current):
+    """Return True if two PO files only differ by references or header dates.
+
+    Args:
+        previous: (str) Text of the previous PO file.
+        current: (str) Text of the current PO file.
+    """
+    return get_significant_entries(previous) == get_significant_entries(current)
@@ -0,0 +1,59 @@
+"""Record of the source files used to create a project's message files.
+
+The record is stored per project in the project cache directory, and
+holds a fingerprint of the translatable source files and message files
+at the commit last processed. When the fingerprint is unchanged, the
+message files are already up to date and creating them can be skipped.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from fnmatch import fnmatch
+from utils import read_json_file, write_json_file
+
+RECORD_FILENAME = "message-sources.json"
+DEFAULT_SOURCE_PATTERNS = [
+    "*.py",
+    "*.html",
+    "*.txt",
+]
+
+
+def get_record_path(project):
+    return os.path.join(project.cache_directory, RECORD_FILENAME)
+
+
+def get_message_sources_fingerprint(project, message_files):
+    """Return a fingerprint of the translatable source files at HEAD.
+
+    The fingerprint covers the object IDs of all files matching the
+    project's source patterns, the message files, and the commands used
+    to create the message files.
+
+    Args:
+        message_files: (list of str) Paths of message files.
+
+    Returns:
+        Hex digest string.
+    """
+    translation_data = project.config["translation"]
+    patterns = translation_data.get("message-source-files", DEFAULT_SOURCE_PATTERNS)
+    fingerprint = hashlib.sha256()
+    fingerprint.update(json.dumps(translation_data["commands"], sort_keys=True).encode("utf-8"))
+    for (path, object_id) in sorted(project.git.get_tree_files().items()):
+        if path in message_files or any(fnmatch(path, pattern) for pattern in patterns):
+            fingerprint.update("{}\0{}\0".format(path, object_id).encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def load_message_sources_fingerprint(project):
+    """Return the fingerprint from the last successful update, or None."""
+    return read_json_file(get_record_path(project), "fingerprint")
+
+
+def save_message_sources_fingerprint(project, fingerprint):
+    """Write the fingerprint to the project cache directory."""
+    write_json_file(get_record_path(project), "fingerprint", fingerprint)
+    logging.info("Saved message sources fingerprint.")
@@ -1,24 +1,27 @@
 import os
 import logging
 import glob
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from zipfile import ZipFile
-from shutil import copy
-from utils import (
-    checkout_branch,
-    run_shell,
-    git_reset,
-    render_text,
-)
-from .crowdin_api import api_call, download_translations
+from shutil import copy, copyfileobj
+from utils import render_text
+from utils.github_api import has_open_pull, record_pull
+from utils.run_journal import get_input_hash, get_unit_name
+from metrics import span
+from .crowdin_api import api_call, download_translations, wait_for_export
 from .constants import BRANCH_PREFIX, SOURCE_LANGUAGE
 from .utils import (
     reset_message_file_comments,
-    get_existing_files_at_head,
     LANGUAGE_MAPPING_OVERRIDES,
 )
 
 TRANSLATION_ZIP = "crowdin-translations.zip"
-TEMPORARY_TRANSLATION_DIRECTORY = "project-translations"
+# Maximum number of concurrent Crowdin requests when planning languages
+PLANNING_WORKERS = 4
+# Default maximum number of languages processed concurrently
+PULL_WORKERS = 4
+WORKTREES_DIRECTORY = "worktrees"
 
 
 def get_language_mapping(project):
@@ -53,6 +56,62 @@ def get_project_languages(project):
     return active_languages
 
 
+def get_language_approved_files(project, crowdin_language_code):
+    """Return the set of approved files for a language.
+
+    See https://support.crowdin.com/api/language-status/
+    """
+    response = api_call("language-status", project, json=True, language=crowdin_language_code)
+    response.raise_for_status()
+    return get_approved_files(response.json())
+
+
+def get_language_plan(project):
+    """Fetch project languages and their approved files, and plan which to pull.
+
+    The supported languages, project status, and the status of every active
+    language are requested concurrently. If languages were given on the
+    command line (or by a webhook job), only those languages are planned.
+    Languages with no approved files are only planned if the project has
+    file overrides, which are copied for every active language.
+
+    Returns:
+        List of dictionaries for each planned language, with keys
+        crowdin_code, source_language, destination_language, and
+        approved_files.
+    """
+    has_file_overrides = bool(project.config["translation"].get("file-overrides"))
+    with ThreadPoolExecutor(max_workers=PLANNING_WORKERS) as executor:
+        locale_mapping_future = executor.submit(get_language_mapping, project)
+        project_languages = get_project_languages(project)
+        if project.cli_args.languages:
+            project_languages = [code for code in project_languages if code in project.cli_args.languages]
+        approved_files_futures = [
+            (crowdin_language_code, executor.submit(get_language_approved_files, project, crowdin_language_code))
+            for crowdin_language_code in project_languages
+        ]
+        locale_mapping = locale_mapping_future.result()
+        languages = []
+        skipped_languages = []
+        for (crowdin_language_code, approved_files_future) in approved_files_futures:
+            approved_files = approved_files_future.result()
+            destination_language = locale_mapping[crowdin_language_code]["django_code"]
+            if approved_files or has_file_overrides:
+                languages.append({
+                    "crowdin_code": crowdin_language_code,
+                    "source_language": locale_mapping[crowdin_language_code]["osx_locale"],
+                    "destination_language": destination_language,
+                    "approved_files": approved_files,
+                })
+            else:
+                skipped_languages.append(destination_language)
+
+    logging.info("Languages to pull: {}".format(", ".join(language["destination_language"] for language in languages)))
+    if skipped_languages:
+        logging.info("Languages with no approved files, skipping: {}".format(", ".join(skipped_languages)))
+    return languages
+
+
 def get_approved_files(language_status):
     approved_files = set()
     for node in language_status.get("files", list()):
@@ -74,7 +133,16 @@ def get_approved_node_files(node, parent_path=""):
     return approved_files
 
 
-def copy_approved_files(project, extract_location, approved_files, source_language, destination_language):
+def copy_approved_files(project, directory, zipped_translations, approved_files, source_language,
+                        destination_language):
+    """Copy approved files for a language from the translations ZIP.
+
+    Only the approved files are read from the ZIP, nothing else is extracted.
+
+    Args:
+        directory: (str) Root directory of the checkout to copy files into.
+    """
+    zip_members = {name.lstrip("/"): name for name in zipped_translations.namelist()}
     approved_path = os.sep + SOURCE_LANGUAGE + os.sep
     source_path = os.sep + source_language + os.sep
     destination_path = os.sep + destination_language + os.sep
@@ -82,32 +150,31 @@ def copy_approved_files(project, extract_location, approved_files, source_langua
     for approved_file in sorted(list(approved_files)):
         approved_file_source = approved_file.replace(approved_path, source_path)
         approved_file_destination = approved_file.replace(approved_path, destination_path)
-        source = os.path.join(
-            extract_location,
-            approved_file_source
-        )
+        source = zip_members.get(approved_file_source)
         destination = os.path.join(
-            project.directory,
+            directory,
             approved_file_destination
         )
+        if source is None:
+            message = "Could not copy file {} to {}, it probably doesn't exist. Check if Crowdin has outdated files."
+            logging.error(message.format(approved_file_source, destination))
+            continue
         destination_directory = os.path.dirname(destination)
         if not os.path.exists(destination_directory):
             os.makedirs(destination_directory, exist_ok=True)
-        try:
-            copy(source, destination)
-            logging.info("Copied {}".format(approved_file_destination))
-        except FileNotFoundError:
-            logging.error("Could not copy file {} to {}, it probably doesn't exist. Check if Crowdin has outdated files.".format(source, destination))
+        with zipped_translations.open(source) as source_file, open(destination, "wb") as destination_file:
+            copyfileobj(source_file, destination_file)
+        logging.info("Copied {}".format(approved_file_destination))
 
     # Check file overrides
     override_filenames = project.config["translation"].get("file-overrides", list())
     for override_filename in override_filenames:
         source = os.path.join(
-            project.directory,
+            directory,
             override_filename
         )
         destination = os.path.join(
-            project.directory,
+            directory,
             override_filename.replace(approved_path, destination_path)
         )
         destination_directory = os.path.dirname(destination)
@@ -122,62 +189,168 @@ def copy_approved_files(project, extract_location, approved_files, source_langua
                 if not current_contents.startswith(YAML_HEADER):
                     f.seek(0)
                     f.write(YAML_HEADER + current_contents)
-        logging.info("Copied {} (set by override)".format(approved_file_destination))
+        logging.info("Copied {} (set by override)".format(os.path.relpath(destination, directory)))
 
 
 def pull_translations(project):
-    locale_mapping = get_language_mapping(project)
-    project_languages = get_project_languages(project)
-
-    # Download ZIP of translations
-    download_translations(project, TRANSLATION_ZIP)
-    extract_location = os.path.join(project.parent_directory, TEMPORARY_TRANSLATION_DIRECTORY)
-    with ZipFile(TRANSLATION_ZIP, "r") as zipped_translations:
-        zipped_translations.extractall(extract_location)
-    os.remove(TRANSLATION_ZIP)
-
-    for crowdin_language_code in project_languages:
-        source_language = locale_mapping[crowdin_language_code]["osx_locale"]
-        destination_language = locale_mapping[crowdin_language_code]["django_code"]
+    languages = get_language_plan(project)
+    completed_languages = [
+        language["destination_language"] for language in languages
+        if project.journal.is_complete(*get_language_unit(project, language))
+    ]
+    if completed_languages:
+        logging.info("Languages pulled by the previous run, skipping: {}".format(", ".join(completed_languages)))
+        languages = [language for language in languages if language["destination_language"] not in completed_languages]
+    if not languages:
+        logging.info("No languages to pull.")
+        return
+
+    # Download ZIP of translations, outside of the repository
+    translation_zip = os.path.join(project.cache_directory, TRANSLATION_ZIP)
+    os.makedirs(project.cache_directory, exist_ok=True)
+    wait_for_export(project)
+    download_translations(project, translation_zip)
+    try:
+        with ZipFile(translation_zip, "r") as zipped_translations:
+            pull_language_translations(project, zipped_translations, languages)
+    finally:
+        os.remove(translation_zip)
+
+
+def pull_language_translations(project, zipped_translations, languages):
+    """Pull translations for each language in its own git worktree.
+
+    Languages are processed concurrently by a bounded pool of workers,
+    configurable with the translation pull-workers config key. All
+    worktrees share the object store of the project repository. Each
+    language pulled is recorded in the run journal.
+
+    Raises:
+        RuntimeError if any language could not be processed.
+    """
+    target_branch = project.config["translation"]["branches"]["translation-target"]
+    worktrees_directory = os.path.join(project.cache_directory, WORKTREES_DIRECTORY)
+    project.git.run(["fetch", "origin", "--prune", "--quiet"])
+    project.git.prune_worktrees()
+    remote_branches = get_remote_branches(project.git)
+    github_lock = Lock()
+    max_workers = project.config["translation"].get("pull-workers", PULL_WORKERS)
+    failed_languages = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (
+                language,
+                executor.submit(
+                    pull_language,
+                    project,
+                    zipped_translations,
+                    language,
+                    target_branch,
+                    worktrees_directory,
+                    remote_branches,
+                    github_lock,
+                ),
+            )
+            for language in languages
+        ]
+        for (language, future) in futures:
+            try:
+                future.result()
+            except Exception:
+                logging.exception("Error while processing '{}' language.".format(language["destination_language"]))
+                failed_languages.append(language["destination_language"])
+            else:
+                project.journal.record(*get_language_unit(project, language))
+    if failed_languages:
+        raise RuntimeError("Could not pull translations for languages: {}".format(", ".join(failed_languages)))
+
+
+def get_language_unit(project, language):
+    """Return the run journal unit of pulling a language, and a hash of its inputs.
+
+    The inputs are the approved files of the language, and the commit they
+    are pulled onto.
+    """
+    return (
+        get_unit_name(project.name, "pull-translations", language["destination_language"]),
+        get_input_hash(language["source_language"], sorted(language["approved_files"]), project.head_commit),
+    )
+
+
+def get_remote_branches(repository):
+    """Return the set of branch names on the origin remote."""
+    result = repository.run(["for-each-ref", "--format=%(refname:lstrip=3)", "refs/remotes/origin/"])
+    return set(result.stdout.decode("utf-8").split())
+
+
+def pull_language(project, zipped_translations, language, target_branch, worktrees_directory, remote_branches,
+                  github_lock):
+    """Update the translation branch of a single language, and open a pull request if required."""
+    # Languages are pulled on worker threads, so the span is given the task label
+    with span("language", language["destination_language"], task="pull-translations",
+              language=language["destination_language"]):
+        source_language = language["source_language"]
+        destination_language = language["destination_language"]
+        approved_files = language["approved_files"]
         logging.info("Processing '{}' language...".format(destination_language))
-        target_branch = project.config["translation"]["branches"]["translation-target"]
         pr_branch = BRANCH_PREFIX + destination_language
-        checkout_branch(target_branch)
-        checkout_branch(pr_branch)
-        run_shell(["git", "merge", "origin/" + target_branch, "--quiet", "--no-edit"])
-        response = api_call("language-status", project, json=True, language=crowdin_language_code)
-        approved_files = get_approved_files(response.json())
-
-        existing_files = get_existing_files_at_head()
-        copy_approved_files(project, extract_location, approved_files, source_language, destination_language)
-
-        run_shell(["git", "add", "-A"])
-        message_files = glob.glob("./**/{}/**/*.po".format(destination_language), recursive=True)
-        for message_file_path in message_files:
-            if message_file_path[2:] in existing_files:
-                reset_message_file_comments(message_file_path)
-        diff_result = run_shell(["git", "diff", "--cached", "--quiet"], check=False)
-        if diff_result.returncode == 1:
-            logging.info("Changes to ({}/{}) language to push.".format(source_language, destination_language))
-            run_shell(["git", "commit", "-m", "Update '{}' language translations".format(destination_language)])
-            run_shell(["git", "push", "origin", pr_branch])
-            existing_pulls = project.repo.get_pulls(state="open", head="uccser:" + pr_branch, base=target_branch)
-            if len(list(existing_pulls)) > 0:
-                logging.info("Existing pull request detected.")
+        worktree = os.path.join(worktrees_directory, pr_branch)
+        if pr_branch in remote_branches:
+            start_point = "origin/" + pr_branch
+        else:
+            start_point = "origin/" + target_branch
+        repository = project.git.add_worktree(worktree, start_point, options=["--no-track", "-B", pr_branch])
+        try:
+            repository.run(["merge", "origin/" + target_branch, "--quiet", "--no-edit"])
+
+            existing_files = repository.get_tree_files("HEAD")
+            copy_approved_files(
+                project,
+                worktree,
+                zipped_translations,
+                approved_files,
+                source_language,
+                destination_language,
+            )
+
+            repository.run(["add", "-A"])
+            message_files = glob.glob(os.path.join(worktree, "**", destination_language, "**", "*.po"), recursive=True)
+            message_files = [os.path.relpath(message_file_path, worktree) for message_file_path in message_files]
+            reset_message_file_comments(
+                [message_file_path for message_file_path in message_files if message_file_path in existing_files],
+                repository,
+            )
+            if repository.has_staged_changes():
+                logging.info("Changes to ({}/{}) language to push.".format(source_language, destination_language))
+                repository.run(["commit", "-m", "Update '{}' language translations".format(destination_language)])
+                repository.run(["push", "--quiet", "origin", pr_branch])
+                with github_lock:
+                    create_language_pull_request(project, destination_language, pr_branch, target_branch)
             else:
-                context = {
-                    "language": destination_language,
-                }
-                header_text = render_text("translation/templates/pr-pull-translations-header.txt", context)
-                body_text = render_text("translation/templates/pr-pull-translations-body.txt", context)
-                pull = project.repo.create_pull(
+                logging.info("No changes to ({}/{}) translation to push.".format(
+                    source_language,
+                    destination_language,
+                ))
+        finally:
+            project.git.remove_worktree(worktree)
+
+
+def create_language_pull_request(project, destination_language, pr_branch, target_branch):
+    if has_open_pull(project, pr_branch, target_branch):
+        logging.info("Existing pull request detected.")
+    else:
+        context = {
+            "language": destination_language,
+        }
+        header_text = render_text("translation/templates/pr-pull-translations-header.txt", context)
+        body_text = render_text("translation/templates/pr-pull-translations-body.txt", context)
+        with span("github", "create_pull"):
+            pull = project.repo.create_pull(
                 title=header_text,
                 body=body_text,
                 base=target_branch,
                 head=pr_branch,
-                )
-                pull.add_to_labels("internationalization")
-                logging.info("Pull request created: {} (#{})".format(pull.title, pull.number))
-        else:
-            logging.info("No changes to ({}/{}) translation to push.".format(source_language, destination_language))
-        git_reset()
+            )
+            pull.add_to_labels("internationalization")
+        record_pull(project, pull, pr_branch, target_branch)
+        logging.info("Pull request created: {} (#{})".format(pull.title, pull.number))
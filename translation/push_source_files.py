@@ -1,22 +1,30 @@
 """Modules used in translating repositories."""
 
 import os
+import logging
 from .crowdin_api import (
-    upload_file_to_crowdin,
+    upload_files_to_crowdin,
     create_crowdin_directory,
+    get_project_tree,
+    UPLOAD_BATCH_FILES,
+    UPLOAD_BATCH_BYTES,
 )
 from .constants import SOURCE_LANGUAGE
-from utils import (
-    git_reset,
-    checkout_branch,
+from .source_file_manifest import (
+    load_manifest,
+    save_manifest,
 )
+from utils import get_file_hash
 
 
 def push_source_files(project):
-    checkout_branch(project.config["translation"]["branches"]["translation-source"])
+    project.git.checkout_branch(project.config["translation"]["branches"]["translation-source"])
     translation_data = project.config["translation"]
-    existing_directories = set()
     valid_file_types = tuple(translation_data["file-types"])
+    (existing_files, existing_directories) = get_project_tree(project)
+    manifest = load_manifest(project, existing_files)
+    changed_files = dict()
+    unchanged_count = 0
 
     for source_directory_path in translation_data["source-directories"]:
         source_directory = source_directory_path.format(language=SOURCE_LANGUAGE)
@@ -29,7 +37,9 @@ def push_source_files(project):
                 existing_directories.add(directory_path)
             i += 1
 
-        for current_directory, directories, files in os.walk(source_directory):
+        for current_directory, directories, files in os.walk(os.path.join(project.directory, source_directory)):
+            # Paths on Crowdin are relative to the root of the repository
+            current_directory = os.path.relpath(current_directory, project.directory)
             for directory in sorted(directories):
                 directory_path = os.path.join(current_directory, directory)
                 if directory_path not in existing_directories:
@@ -39,5 +49,32 @@ def push_source_files(project):
             for filename in sorted(files):
                 if filename.endswith(valid_file_types):
                     file_path = os.path.join(current_directory, filename)
-                    upload_file_to_crowdin(file_path, project)
-    git_reset()
+                    file_hash = get_file_hash(os.path.join(project.directory, file_path))
+                    if manifest.get(file_path) == file_hash:
+                        unchanged_count += 1
+                    else:
+                        changed_files[file_path] = file_hash
+
+    outcomes = upload_files_to_crowdin(
+        list(changed_files.keys()),
+        project,
+        existing_files=existing_files,
+        max_files=translation_data.get("upload-batch-files", UPLOAD_BATCH_FILES),
+        max_bytes=translation_data.get("upload-batch-bytes", UPLOAD_BATCH_BYTES),
+    )
+    failed_count = 0
+    for (file_path, outcome) in outcomes.items():
+        if outcome == "failed":
+            failed_count += 1
+        else:
+            manifest[file_path] = changed_files[file_path]
+    save_manifest(project, manifest)
+    logging.info("{} files uploaded, {} failed, {} unchanged files skipped.".format(
+        len(outcomes) - failed_count,
+        failed_count,
+        unchanged_count,
+    ))
+    project.git.reset()
+    # Files uploaded are kept in the manifest, but the task fails so it is retried
+    if failed_count:
+        raise RuntimeError("Could not upload {} source files to Crowdin.".format(failed_count))
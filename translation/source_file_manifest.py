@@ -0,0 +1,47 @@
+"""Manifest of source file content hashes uploaded to Crowdin.
+
+The manifest is stored per project in the project cache directory, and
+maps each Crowdin file path to the SHA-256 hash of the content last
+uploaded. Files with a matching hash are not uploaded again.
+"""
+
+import os
+import logging
+from utils import read_json_file, write_json_file
+
+MANIFEST_FILENAME = "crowdin-source-manifest.json"
+
+
+def get_manifest_path(project):
+    return os.path.join(project.cache_directory, MANIFEST_FILENAME)
+
+
+def load_manifest(project, crowdin_file_paths):
+    """Load the source file manifest for the project.
+
+    Entries for files that no longer exist on Crowdin are removed, so they
+    are uploaded again. If no manifest exists, it is rebuilt from the list
+    of files on Crowdin. The Crowdin API doesn't provide content hashes,
+    so rebuilt entries have no hash and are uploaded once.
+
+    Args:
+        crowdin_file_paths: (set of str) Paths of files on Crowdin.
+
+    Returns:
+        Dictionary mapping Crowdin file paths to content hashes (or None).
+    """
+    stored_hashes = read_json_file(get_manifest_path(project), "files")
+    if stored_hashes is None:
+        logging.info("Source file manifest not found or invalid, rebuilding from Crowdin.")
+        stored_hashes = dict()
+    else:
+        logging.info("Loaded source file manifest ({} files).".format(len(stored_hashes)))
+    manifest = dict()
+    for file_path in crowdin_file_paths:
+        manifest[file_path] = stored_hashes.get(file_path)
+    return manifest
+
+
+def save_manifest(project, manifest):
+    """Write the manifest to the project cache directory."""
+    write_json_file(get_manifest_path(project), "files", manifest)
@@ -3,37 +3,53 @@
 import logging
 from utils import (
     run_shell,
-    checkout_branch,
-    git_reset,
     render_text,
 )
+from utils.docker import (
+    docker_lock,
+    get_image_ids,
+    get_build_inputs_hash,
+    remove_stale_images,
+    record_project_images,
+    evict_images,
+    DEFAULT_BUILD_INPUT_PATTERNS,
+)
+from utils.github_api import has_open_pull, record_pull
+from metrics import span
 from .constants import BRANCH_PREFIX
 from .utils import reset_message_file_comments
+from .message_sources import (
+    get_message_sources_fingerprint,
+    load_message_sources_fingerprint,
+    save_message_sources_fingerprint,
+)
+
+# Default seconds each project command may run for before it is stopped
+COMMAND_TIMEOUT = 60 * 60
 
 
 def update_source_message_file(project):
     translation_data = project.config["translation"]
-    checkout_branch(translation_data["branches"]["translation-source"])
+    project.git.checkout_branch(translation_data["branches"]["translation-source"])
     target_branch = translation_data["branches"]["update-messages-target"]
     pr_branch = BRANCH_PREFIX + "update-messages"
-    checkout_branch(pr_branch)
-    run_shell(["git", "merge", "origin/" + target_branch, "--quiet", "--no-edit"])
-    run_shell(translation_data["commands"]["start"])
-    run_shell(translation_data["commands"]["makemessages"])
-    run_shell(translation_data["commands"]["end"])
+    project.git.checkout_branch(pr_branch)
+    project.git.run(["merge", "origin/" + target_branch, "--quiet", "--no-edit"])
     message_files = translation_data["django-message-file"]
     if not isinstance(message_files, list):
         message_files = [message_files]
-    for message_file in message_files:
-        run_shell(["git", "add", message_file])
-        reset_message_file_comments(message_file)
-    diff_result = run_shell(["git", "diff", "--cached", "--quiet"], check=False)
-    if diff_result.returncode == 1:
+    if get_message_sources_fingerprint(project, message_files) == load_message_sources_fingerprint(project):
+        logging.info("No changes to translatable source files since last update, skipping.")
+        project.git.reset()
+        return
+    run_project_commands(project, translation_data)
+    project.git.stage(message_files)
+    reset_message_file_comments(message_files, project.git)
+    if project.git.has_staged_changes():
         logging.info("Changes to source message files to push.")
-        run_shell(["git", "commit", "-m", "Update source language message files"])
-        run_shell(["git", "push", "origin", pr_branch])
-        existing_pulls = project.repo.get_pulls(state="open", head="uccser:" + pr_branch, base=target_branch)
-        if len(list(existing_pulls)) > 0:
+        project.git.run(["commit", "--quiet", "-m", "Update source language message files"])
+        project.git.run(["push", "--quiet", "origin", pr_branch])
+        if has_open_pull(project, pr_branch, target_branch):
             logging.info("Existing pull request detected.")
         else:
             context = {
@@ -47,15 +63,42 @@ def update_source_message_file(project):
                 "translation/templates/pr-update-source-messages-body.txt",
                 context
             )
-            pull = project.repo.create_pull(
-                title=header_text,
-                body=body_text,
-                base=target_branch,
-                head=pr_branch,
-            )
-            pull.add_to_labels("internationalization")
+            with span("github", "create_pull"):
+                pull = project.repo.create_pull(
+                    title=header_text,
+                    body=body_text,
+                    base=target_branch,
+                    head=pr_branch,
+                )
+                pull.add_to_labels("internationalization")
+            record_pull(project, pull, pr_branch, target_branch)
             logging.info("Pull request created: {} (#{})".format(pull.title, pull.number))
     else:
         logging.info("No changes to source message files to push.")
-    git_reset()
-    run_shell(["docker", "system", "prune", "--volumes", "-a", "-f"])
+    project.git.reset()
+    save_message_sources_fingerprint(project, get_message_sources_fingerprint(project, message_files))
+
+
+def run_project_commands(project, translation_data):
+    """Run the project's commands to create its message files.
+
+    Docker images built by the commands are kept for the next run while
+    the project's build input files are unchanged, within the shared
+    Docker cache size. If the build input files have changed, the kept
+    images are removed before the commands run, so they are rebuilt.
+    """
+    timeout = translation_data.get("command-timeout", COMMAND_TIMEOUT)
+    build_input_patterns = translation_data.get("docker-cache-files", DEFAULT_BUILD_INPUT_PATTERNS)
+    inputs_hash = get_build_inputs_hash(project.directory, build_input_patterns)
+    budget_bytes = int(project.cli_args.docker_cache_size * 1e9)
+    with docker_lock(project.shared_cache_directory):
+        remove_stale_images(project.shared_cache_directory, project.name, inputs_hash)
+        initial_image_ids = get_image_ids()
+        try:
+            run_shell(translation_data["commands"]["start"], cwd=project.directory, timeout=timeout)
+            run_shell(translation_data["commands"]["makemessages"], cwd=project.directory, timeout=timeout)
+            run_shell(translation_data["commands"]["end"], cwd=project.directory, timeout=timeout)
+        finally:
+            new_image_ids = get_image_ids() - initial_image_ids
+            record_project_images(project.shared_cache_directory, project.name, inputs_hash, new_image_ids)
+            evict_images(project.shared_cache_directory, budget_bytes, keep_project=project.name)
@@ -1,11 +1,5 @@
 import logging
-from utils import run_shell
-
-MESSSAGE_FILE_TRIVAL_LINES = (
-    '"POT-Creation-Date:',
-    '"PO-Revision-Date:',
-    "#: ",
-)
+from .message_files import has_trivial_changes_only
 
 # Crowdin codes to Django codes
 LANGUAGE_MAPPING_OVERRIDES = {
@@ -15,34 +9,36 @@ LANGUAGE_MAPPING_OVERRIDES = {
 }
 
 
-def reset_message_file_comments(message_file_path):
+def reset_message_file_comments(message_file_paths, repository):
     """Unstage any staged PO files that only have comment or date changes.
 
-    This is achieved by checking the diff with HEAD, excluding any comment
-    lines or lines starting with PO-Revision-Date or POT-Creation-Date.
-
-    Must be run from the repository root directory.
-    """
-    previous = run_shell(["git", "show", "HEAD:{}".format(message_file_path)], display=False).stdout.decode("utf-8")
-    current = run_shell(["git", "show", ":{}".format(message_file_path)], display=False).stdout.decode("utf-8")
-    new_lines = list(set(current.split("\n")) - set(previous.split("\n")))
-    unstage_message_file = True
-    i = 0
-    while unstage_message_file and i < len(new_lines):
-        if not new_lines[i].startswith(MESSSAGE_FILE_TRIVAL_LINES):
-            unstage_message_file = False
-        i += 1
-    if unstage_message_file:
-        logging.info("Message file '{}' only has trivial changes, unstaging file...".format(message_file_path))
-        run_shell(["git", "reset", "HEAD", message_file_path])
-
+    This is achieved by parsing the staged and HEAD versions of each file
+    and comparing their entries, ignoring source reference comments and
+    the PO-Revision-Date and POT-Creation-Date header fields. Objects are
+    read through the repository's persistent git process, and all
+    trivially changed files are unstaged with one git reset. Files that
+    are not in HEAD or not staged are left as they are.
 
-def get_existing_files_at_head():
-    """Return a set of all filenames at the git HEAD.
+    Args:
+        message_file_paths: (list of str) Paths of message files, relative
+            to the repository root.
+        repository: (utils.git.GitRepository) Repository of the files.
 
     Returns:
-        Set of filenames.
+        List of message file paths that were unstaged.
     """
-    file_list = run_shell(['git', 'ls-tree', '-r', 'HEAD', '--name-only'], display=False)
-    filenames = file_list.stdout.decode("utf-8").split('\n')
-    return set(filenames)
+    head_files = repository.get_tree_files("HEAD")
+    index_files = repository.get_index_files()
+    trivial_message_files = []
+    for message_file_path in message_file_paths:
+        previous_id = head_files.get(message_file_path)
+        current_id = index_files.get(message_file_path)
+        if previous_id is None or current_id is None or previous_id == current_id:
+            continue
+        previous = repository.objects.read(previous_id).decode("utf-8")
+        current = repository.objects.read(current_id).decode("utf-8")
+        if has_trivial_changes_only(previous, current):
+            logging.info("Message file '{}' only has trivial changes, unstaging file...".format(message_file_path))
+            trivial_message_files.append(message_file_path)
+    repository.unstage(trivial_message_files)
+    return trivial_message_files
@@ -1,39 +1,129 @@
 import os
+import json
+import fcntl
+import hashlib
 import logging
+import importlib
 import yaml
+import signal
+import threading
 import subprocess
-from jinja2 import Template
-from timeit import default_timer as timer
+from collections import deque
+from contextlib import contextmanager
 from string import ascii_uppercase
+from metrics import span, get_current_labels
 
+ARNOLD_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Number of lines of output kept from commands whose output is logged
+OUTPUT_TAIL_LINES = 100
+HASH_CHUNK_SIZE = 1024 * 1024
+# Refs fetched into repository mirrors
+MIRROR_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
 
-def run_shell(commands, display=True, check=True, catch_check_error=True):
+
+def run_shell(commands, display=True, check=True, catch_check_error=True, cwd=None, timeout=None):
     """Run a list of shell commands.
 
+    If display is True, output (including stderr) is logged line by line
+    as it arrives, and only the last lines are kept in memory. Otherwise
+    stdout and stderr are captured in full.
+
     Args:
         commands (list of strings OR list of lists of strings).
+        display (bool): True to log the output of the commands.
+        check (bool): True to raise an error if a command fails.
+        catch_check_error (bool): True to raise RuntimeError instead of
+            subprocess.CalledProcessError if a command fails.
+        cwd (string): Directory to run the commands in, defaults to the
+            current directory.
+        timeout (number): Seconds each command may run before it and its
+            child processes are killed, and subprocess.TimeoutExpired is
+            raised. Defaults to no limit.
+
+    Returns:
+        subprocess.CompletedProcess of the last command. If display is
+        True, stdout only contains the last lines of output.
     """
     if not all(isinstance(command, list) for command in commands):
         commands = [commands]
     for command in commands:
-        try:
-            result = subprocess.run(command, check=check, stdout=subprocess.PIPE)
-        except subprocess.CalledProcessError as e:
-            if catch_check_error:
-                try:
-                    # Refresh shell directories and retry in shell
-                    subprocess.run('cd .', shell=True)
-                    result = subprocess.run(command, shell=True, check=check, stdout=subprocess.PIPE)
-                except:
-                    raise RuntimeError("Command '{}' return with error (code {}): {}".format(e.cmd, e.returncode, e.output))
+        with span("shell", " ".join(command[:2])) as command_span:
+            if display:
+                result = run_streaming_command(command, cwd, timeout)
             else:
-                raise
-        result_message = result.stdout.decode("utf-8")
-        if display and result_message:
-            logging.info(result_message)
+                result = run_captured_command(command, cwd, timeout)
+            command_span.bytes_received = len(result.stdout)
+            if check and result.returncode != 0:
+                if catch_check_error:
+                    message = "Command '{}' return with error (code {}): {}"
+                    output = (result.stdout + (result.stderr or b"")).decode("utf-8", "replace")
+                    raise RuntimeError(message.format(command, result.returncode, output))
+                raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
     return result
 
 
+def run_captured_command(command, cwd, timeout):
+    """Run a command, capturing all of stdout and stderr."""
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+    )
+    try:
+        (stdout, stderr) = process.communicate(timeout=timeout)
+    except BaseException:
+        kill_process_group(process)
+        raise
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def run_streaming_command(command, cwd, timeout):
+    """Run a command, logging each line of output as it arrives.
+
+    Stderr is merged into stdout, and only the last OUTPUT_TAIL_LINES lines
+    are kept.
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd=cwd,
+        start_new_session=True,
+    )
+    output_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    # Output is logged on another thread, so is given the labels of this one
+    log_fields = {"command_output": True, "labels": get_current_labels()}
+
+    def read_output():
+        for line in process.stdout:
+            output_tail.append(line)
+            logging.info(line.decode("utf-8", "replace").rstrip(), extra=log_fields)
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    try:
+        process.wait(timeout=timeout)
+    except BaseException:
+        logging.error("Command '{}' cancelled or timed out, stopping command...".format(" ".join(command)))
+        kill_process_group(process)
+        raise
+    finally:
+        reader.join()
+        process.stdout.close()
+    return subprocess.CompletedProcess(command, process.returncode, b"".join(output_tail), None)
+
+
+def kill_process_group(process):
+    """Kill a process started in its own session, and all of its children."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
 def read_secrets(required_secrets):
     logging.info("Reading secrets file...")
     with open("secrets.yaml", "r") as secrets_file:
@@ -54,30 +144,57 @@ def read_secrets(required_secrets):
     return secrets
 
 
-def checkout_branch(branch):
-    try:
-        logging.info("Checking out to existing branch on GitHub")
-        result = run_shell(["git", "checkout", branch], display=False, catch_check_error=False)
-    except subprocess.CalledProcessError:
-        logging.info("Checking out to new branch")
-        result = run_shell(["git", "checkout", "-b", branch])
-    logging.info(result.stdout.decode("utf-8"))
-    try:
-        run_shell(["git", "pull"], catch_check_error=False)
-    except subprocess.CalledProcessError:
-        logging.info("Cannot pull (branch {} probably doesn't exist on GitHub), skipping step.".format(branch))
+def import_keeping_log_handlers(module_name):
+    """Import a module, keeping the handlers of the root logger.
+
+    Linkie replaces the handlers of the root logger when imported, which
+    would remove the console and Cloud Logging handlers set up by run.py.
+    The handlers are only restored if there were any to begin with.
+
+    Returns:
+        The imported module.
+    """
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers[:]
+    module = importlib.import_module(module_name)
+    if handlers:
+        root_logger.handlers = handlers
+    return module
 
 
 def render_text(path, context):
-    with open(os.path.join("../../", path), "r") as f:
+    # Imported here, as templates are only rendered by some tasks
+    from jinja2 import Template
+    with open(os.path.join(ARNOLD_DIRECTORY, path), "r") as f:
         template_string = f.read()
     return Template(template_string).render(context)
 
 
-def display_elapsed_time(start_time):
-    mins = (timer() - start_time) // 60
-    secs = (timer() - start_time) % 60
-    logging.info("Process took {:.0f}m {:.1f}s.\n".format(mins, secs))
+class RepositoryLogFilter(logging.Filter):
+    """Label log records with the name of the repository being processed.
+
+    Added to handlers rather than loggers, so records of every logger are
+    labelled, including those propagated from library loggers.
+    """
+
+    def __init__(self, repo_name):
+        super().__init__()
+        self.repo_name = repo_name
+
+    def filter(self, record):
+        record.repo = self.repo_name
+        return True
+
+
+class RepositoryLogFormatter(logging.Formatter):
+    """Prefix messages with the repository of the record, if it has one."""
+
+    def format(self, record):
+        message = super().format(record)
+        repo_name = getattr(record, "repo", None)
+        if repo_name:
+            message = "[{}] {}".format(repo_name, message)
+        return message
 
 
 def get_crowdin_api_key(project_name, secrets):
@@ -93,6 +210,170 @@ def get_crowdin_api_key(project_name, secrets):
         raise LookupError(message.format(key))
     return value
 
-def git_reset():
-    run_shell(["git", "reset", "--hard"])
-    run_shell(["sudo", "git", "clean", "-fdx"])
+
+def get_file_hash(file_path):
+    """Return the SHA-256 hex digest of a file's content."""
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def read_json_file(path, key, default=None):
+    """Return the value stored under a key of a JSON file.
+
+    Returns:
+        The value, or the default if the file is missing or invalid.
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)[key]
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return default
+
+
+def write_json_file(path, key, value):
+    """Write a value under a key of a JSON file, replacing the file atomically."""
+    write_file_atomically(path, json.dumps({key: value}, indent=2, sort_keys=True))
+
+
+def write_file_atomically(path, text):
+    """Write text to a file, so readers never see a partly written file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        f.write(text)
+    os.replace(temporary_path, path)
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive lock on a file, shared between processes."""
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def remove_directory(path):
+    """Delete a directory, including any files created by root in Docker."""
+    if os.path.exists(path):
+        run_shell(["sudo", "rm", "-r", path])
+
+
+def is_git_directory(path, bare=False):
+    """Return True if the path is the root of a readable git repository.
+
+    Args:
+        path: (str) Path of the directory to check.
+        bare: (bool) True if the repository is expected to be bare.
+    """
+    if not os.path.isdir(path):
+        return False
+    result = subprocess.run(
+        ["git", "-C", path, "rev-parse", "--absolute-git-dir"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        return False
+    git_directory = result.stdout.decode("utf-8").strip()
+    expected_directory = path if bare else os.path.join(path, ".git")
+    # Without this check, a missing repository would match a parent repository
+    return os.path.realpath(git_directory) == os.path.realpath(expected_directory)
+
+
+def is_shallow_clone(directory):
+    """Return True if the clone in the directory has a shallow history."""
+    return os.path.exists(os.path.join(directory, ".git", "shallow"))
+
+
+def has_alternates(directory):
+    """Return True if the clone in the directory borrows objects from another repository."""
+    return os.path.exists(os.path.join(directory, ".git", "objects", "info", "alternates"))
+
+
+def get_fetch_refspecs(repository_path):
+    """Return the list of fetch refspecs of a repository's origin remote."""
+    result = subprocess.run(
+        ["git", "-C", repository_path, "config", "--get-all", "remote.origin.fetch"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    return result.stdout.decode("utf-8").split()
+
+
+def update_mirror(url, mirror_path):
+    """Fetch new objects into a bare mirror of a repository.
+
+    Only branches and tags are fetched, as fetching all refs would also
+    fetch every pull request on GitHub. The mirror is created if it
+    doesn't exist, and is deleted and recreated if it is corrupted or
+    fetches other refs.
+    """
+    if is_git_directory(mirror_path, bare=True):
+        if get_fetch_refspecs(mirror_path) == MIRROR_REFSPECS:
+            logging.info("Updating repository mirror {}...".format(mirror_path))
+            try:
+                run_shell(["git", "-C", mirror_path, "fetch", "--prune", "--quiet"], catch_check_error=False)
+                return
+            except subprocess.CalledProcessError:
+                logging.warning("Repository mirror {} could not be updated, recreating mirror...".format(mirror_path))
+        else:
+            logging.info("Repository mirror {} fetches other refs, recreating mirror...".format(mirror_path))
+    remove_directory(mirror_path)
+    logging.info("Creating repository mirror {}...".format(mirror_path))
+    run_shell(
+        [
+            ["git", "clone", "--bare", "--quiet", url, mirror_path],
+            ["git", "-C", mirror_path, "config", "remote.origin.fetch", MIRROR_REFSPECS[0]],
+        ] + [
+            ["git", "-C", mirror_path, "config", "--add", "remote.origin.fetch", refspec]
+            for refspec in MIRROR_REFSPECS[1:]
+        ]
+    )
+
+
+def reset_working_copy(directory, branch):
+    """Fetch and reset an existing clone to match the given remote branch.
+
+    Local branches left from previous runs are deleted if all their
+    commits are on the branch of the same name on origin, so the clone is
+    in the same state as a fresh clone. Other local branches are kept, so
+    unpushed commits are never lost, and are logged.
+
+    Raises:
+        subprocess.CalledProcessError if any git command fails.
+    """
+    logging.info("Resetting existing repository to 'origin/{}'...".format(branch))
+    run_shell(
+        [
+            ["git", "-C", directory, "fetch", "origin", "--prune", "--quiet"],
+            ["git", "-C", directory, "checkout", "--force", "-B", branch, "origin/" + branch],
+            ["sudo", "git", "-C", directory, "clean", "-fdx", "--quiet"],
+        ],
+        catch_check_error=False,
+    )
+    result = run_shell(
+        ["git", "-C", directory, "for-each-ref", "--format=%(refname:short)", "refs/heads/"],
+        display=False,
+        catch_check_error=False,
+    )
+    for local_branch in result.stdout.decode("utf-8").split():
+        if local_branch == branch:
+            continue
+        remote_branch = "refs/remotes/origin/" + local_branch
+        is_pushed = run_shell(
+            ["git", "-C", directory, "merge-base", "--is-ancestor", local_branch, remote_branch],
+            display=False,
+            check=False,
+        ).returncode == 0
+        if is_pushed:
+            logging.info("Deleting local branch '{}', which is on origin.".format(local_branch))
+            run_shell(["git", "-C", directory, "branch", "-D", local_branch], catch_check_error=False)
+        else:
+            logging.warning("Keeping local branch '{}', which has commits not on origin.".format(local_branch))
@@ -0,0 +1,219 @@
+"""Sending logs to Google Cloud Logging without slowing down the run.
+
+Records are formatted into entries on the thread that logs them, and
+added to a bounded queue. A background thread creates the Cloud Logging
+client (which looks up credentials, and can take several seconds) when
+the first entries are sent, and sends entries in batches, once enough
+have been queued or they have waited long enough.
+
+When the queue fills up, only a sample of command output lines are
+kept, and other records below WARNING are dropped. Warnings and errors
+wait for space in the queue, so the final error of a run isn't lost.
+"""
+
+import sys
+import queue
+import atexit
+import logging
+import threading
+from time import monotonic
+from datetime import datetime, timezone
+from metrics import get_current_labels
+
+# Name of the Cloud Logging log written to
+LOG_NAME = "python"
+# Maximum number of entries waiting to be sent
+QUEUE_SIZE = 10000
+# Maximum number of entries sent in one request
+BATCH_SIZE = 500
+# Seconds an entry waits for more entries before being sent
+BATCH_INTERVAL = 5
+# Proportion of the queue filled before command output is sampled
+SAMPLING_THRESHOLD = 0.5
+# One in this many command output lines is kept while sampling
+SAMPLE_RATE = 10
+# Seconds a warning or error waits for space in a full queue
+BLOCKING_TIMEOUT = 5
+# Seconds to wait for queued entries to be sent when flushing
+FLUSH_TIMEOUT = 30
+# Labels of the current span added to each entry
+LABEL_NAMES = ("repo", "task", "language")
+# Loggers used while sending entries, whose records are never sent
+EXCLUDED_LOGGERS = ("google.cloud", "google.auth", "google_auth_httplib2", "google.api_core", "urllib3")
+
+
+def create_cloud_logger():
+    """Return a Cloud Logging logger, or None if no credentials are found."""
+    import google.cloud.logging
+    from google.auth.exceptions import DefaultCredentialsError
+    try:
+        client = google.cloud.logging.Client()
+    except DefaultCredentialsError:
+        return None
+    return client.logger(LOG_NAME)
+
+
+def get_record_labels(record):
+    """Return the repository, task, and language labels of a record.
+
+    Labels given with the record (such as for command output logged on
+    another thread) are used, otherwise the labels of the current span.
+    """
+    labels = getattr(record, "labels", None)
+    if labels is None:
+        labels = get_current_labels()
+    labels = dict(labels)
+    if getattr(record, "repo", None):
+        labels.setdefault("repo", record.repo)
+    return {name: str(labels[name]) for name in LABEL_NAMES if labels.get(name)}
+
+
+def flush_log_handlers():
+    """Send all records held by the root logger's handlers."""
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
+
+class AsyncCloudLoggingHandler(logging.Handler):
+    """Logging handler that sends entries to Cloud Logging from a background thread.
+
+    Entries are sent when BATCH_SIZE are queued, when the oldest has
+    waited BATCH_INTERVAL seconds, and when the handler is flushed. If no
+    credentials are found, entries are discarded, and logs are only
+    written locally.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL):
+        super().__init__()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.sampling_size = int(queue_size * SAMPLING_THRESHOLD)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.enabled = True
+        self.cloud_logger = None
+        self.sampled_count = 0
+        self.dropped_count = 0
+        self.addFilter(lambda record: not record.name.startswith(EXCLUDED_LOGGERS))
+        self.thread = threading.Thread(target=self.send_entries, name="cloud-logging", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def emit(self, record):
+        if not self.enabled:
+            return
+        try:
+            entry = self.create_entry(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if getattr(record, "command_output", False) and self.queue.qsize() >= self.sampling_size:
+            self.sampled_count += 1
+            if self.sampled_count % SAMPLE_RATE:
+                self.dropped_count += 1
+                return
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(entry, timeout=BLOCKING_TIMEOUT)
+            else:
+                self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def create_entry(self, record):
+        """Return the Cloud Logging entry of a record, with its structured fields."""
+        payload = {"message": self.format(record), "logger": record.name}
+        payload.update(getattr(record, "json_fields", {}))
+        return {
+            "info": payload,
+            "severity": record.levelname,
+            "labels": get_record_labels(record),
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc),
+        }
+
+    def send_entries(self):
+        """Send queued entries in batches, until the handler is stopped."""
+        while True:
+            entries = []
+            markers = []
+            deadline = None
+            while len(entries) < self.batch_size and not markers:
+                try:
+                    if deadline is None:
+                        item = self.queue.get()
+                    else:
+                        item = self.queue.get(timeout=max(deadline - monotonic(), 0))
+                except queue.Empty:
+                    break
+                if isinstance(item, dict):
+                    entries.append(item)
+                    if deadline is None:
+                        deadline = monotonic() + self.batch_interval
+                else:
+                    # A flush or stop marker, sent once the entries before it are sent
+                    markers.append(item)
+            if entries:
+                self.write_entries(entries)
+            for marker in markers:
+                if marker is None:
+                    return
+                marker.set()
+
+    def write_entries(self, entries):
+        if self.cloud_logger is None and self.enabled:
+            self.cloud_logger = create_cloud_logger()
+            if self.cloud_logger is None:
+                self.enabled = False
+                logging.info("Only logging locally.")
+        if not self.enabled:
+            return
+        if self.dropped_count:
+            entries.append({
+                "info": {"message": "{} log entries were dropped, as logging fell behind.".format(self.dropped_count)},
+                "severity": "WARNING",
+                "labels": {},
+                "timestamp": datetime.now(timezone.utc),
+            })
+            self.dropped_count = 0
+        batch = self.cloud_logger.batch()
+        for entry in entries:
+            batch.log_struct(entry["info"], severity=entry["severity"], labels=entry["labels"],
+                             timestamp=entry["timestamp"])
+        try:
+            batch.commit()
+        except Exception as e:
+            # Logged to stderr, as logging the error would queue another entry
+            sys.stderr.write("Could not send {} log entries to Cloud Logging: {}\n".format(len(entries), e))
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Wait until all entries queued so far are sent.
+
+        Returns:
+            True if the entries were sent within the timeout.
+        """
+        if not self.thread.is_alive():
+            return False
+        marker = threading.Event()
+        try:
+            self.queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(timeout)
+
+    def close(self):
+        """Send all queued entries.
+
+        Entries are still accepted afterwards, as logging.config closes all
+        handlers when used (such as when Linkie is imported).
+        """
+        self.flush()
+        super().close()
+
+    def stop(self):
+        """Send all queued entries, and stop the background thread."""
+        if self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=FLUSH_TIMEOUT)
+            except queue.Full:
+                return
+            self.thread.join(FLUSH_TIMEOUT)
+        self.enabled = False
@@ -0,0 +1,104 @@
+"""Persistent index of the Arnold config of each repository.
+
+The index maps each repository name to the default branch commit and
+time of last push when its config file was read, the parsed config (or
+None), and the tasks the config enables. A repository's config file is
+only read and parsed again when its default branch or last push changes.
+"""
+
+import os
+import logging
+import yaml
+from utils import read_json_file, write_json_file
+
+INDEX_FILENAME = "config-index.json"
+
+
+def get_index_path(cache_directory):
+    return os.path.join(cache_directory, INDEX_FILENAME)
+
+
+def load_config_index(cache_directory):
+    """Load the config index, or return an empty index if none is stored."""
+    config_index = read_json_file(get_index_path(cache_directory), "repositories")
+    if config_index is None:
+        logging.info("Config index not found or invalid, reading all configs.")
+        return dict()
+    return config_index
+
+
+def save_config_index(cache_directory, config_index):
+    """Write the config index to the cache directory."""
+    write_json_file(get_index_path(cache_directory), "repositories", config_index)
+
+
+def get_config_tasks(config, task_config_keys):
+    """Return the list of tasks enabled by a config.
+
+    Args:
+        config: (dict) Arnold config of a repository.
+        task_config_keys: (dict) Mapping of task names to the top level
+            config key that enables the task.
+    """
+    return [task for (task, key) in task_config_keys.items() if config.get(key)]
+
+
+def parse_config(repository_name, config_text):
+    """Parse the text of a config file.
+
+    Returns:
+        Config dictionary, or None if there is no config file or it is invalid.
+    """
+    if config_text is None:
+        return None
+    try:
+        config = yaml.safe_load(config_text)
+    except yaml.YAMLError:
+        logging.error("Error! Arnold config for {} is invalid YAML.".format(repository_name))
+        return None
+    if not isinstance(config, dict):
+        logging.error("Error! Arnold config for {} is not a mapping.".format(repository_name))
+        return None
+    return config
+
+
+def update_config_index(config_index, repository_index, read_config_texts, task_config_keys, complete=True):
+    """Update the config index for repositories that have changed.
+
+    Args:
+        config_index: (dict) Index to update in place.
+        repository_index: (dict) Repository data read from GitHub, mapping
+            repository names to dictionaries with head and pushed_at keys.
+        read_config_texts: (function) Given a list of repository names,
+            returns a dictionary mapping each name to its config text.
+        task_config_keys: (dict) Mapping of task names to the top level
+            config key that enables the task.
+        complete: (bool) True if the repository index covers all
+            repositories, so repositories missing from it are removed.
+
+    Returns:
+        List of names of repositories whose config was read again.
+    """
+    changed_names = []
+    for (name, data) in repository_index.items():
+        entry = config_index.get(name)
+        if entry is None or entry["head"] != data["head"] or entry["pushed_at"] != data["pushed_at"]:
+            changed_names.append(name)
+    if changed_names:
+        config_texts = read_config_texts(sorted(changed_names))
+        for name in changed_names:
+            config = parse_config(name, config_texts.get(name))
+            config_index[name] = {
+                "head": repository_index[name]["head"],
+                "pushed_at": repository_index[name]["pushed_at"],
+                "config": config,
+                "tasks": get_config_tasks(config, task_config_keys) if config else [],
+            }
+    if complete:
+        for name in set(config_index) - set(repository_index):
+            del config_index[name]
+    logging.info("Read Arnold config for {} changed repositories, {} unchanged.".format(
+        len(changed_names),
+        len(repository_index) - len(changed_names),
+    ))
+    return changed_names
@@ -0,0 +1,178 @@
+"""Management of Docker images kept between runs.
+
+Images built for a project are recorded against a hash of the project's
+build input files (such as Dockerfiles and requirements files). Images
+are kept while the inputs are unchanged, replaced when they change, and
+evicted least recently used first when all recorded images exceed a
+disk budget.
+"""
+
+import os
+import glob
+import time
+import hashlib
+import logging
+from contextlib import contextmanager
+from utils import run_shell, file_lock, read_json_file, write_json_file, HASH_CHUNK_SIZE
+
+STATE_FILENAME = "docker-images.json"
+LOCK_FILENAME = "docker.lock"
+DEFAULT_BUILD_INPUT_PATTERNS = [
+    "**/Dockerfile*",
+    "**/requirements*.txt",
+    "**/requirements/*.txt",
+    "docker-compose*.yml",
+]
+
+
+@contextmanager
+def docker_lock(cache_directory):
+    """Hold an exclusive lock on Docker, shared between processes.
+
+    This stops concurrent projects building images at the same time, and
+    keeps the image record consistent.
+    """
+    logging.info("Waiting for Docker lock...")
+    with file_lock(os.path.join(cache_directory, LOCK_FILENAME)):
+        yield
+
+
+def get_image_ids():
+    """Return the set of IDs of all Docker images."""
+    result = run_shell(["docker", "images", "--all", "--quiet", "--no-trunc"], display=False)
+    return set(result.stdout.decode("utf-8").split())
+
+
+def get_image_sizes(image_ids):
+    """Return a dictionary mapping each existing image ID to its size in bytes."""
+    if not image_ids:
+        return dict()
+    result = run_shell(
+        ["docker", "image", "inspect", "--format", "{{.Id}} {{.Size}}"] + sorted(image_ids),
+        display=False,
+        check=False,
+    )
+    sizes = dict()
+    for line in result.stdout.decode("utf-8").splitlines():
+        (image_id, size) = line.split()
+        sizes[image_id] = int(size)
+    return sizes
+
+
+def remove_images(image_ids):
+    if image_ids:
+        logging.info("Removing {} Docker image(s)...".format(len(image_ids)))
+        run_shell(["docker", "image", "rm", "--force"] + sorted(image_ids), display=False, check=False)
+
+
+def get_build_inputs_hash(directory, patterns):
+    """Return a hash of the paths and contents of all files matching the patterns.
+
+    Args:
+        directory: (str) Root directory of the project.
+        patterns: (list of str) Recursive glob patterns, relative to the
+            root directory.
+    """
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(directory, pattern), recursive=True))
+    inputs_hash = hashlib.sha256()
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            inputs_hash.update(os.path.relpath(path, directory).encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    inputs_hash.update(chunk)
+    return inputs_hash.hexdigest()
+
+
+def load_state(cache_directory):
+    return {"projects": read_json_file(os.path.join(cache_directory, STATE_FILENAME), "projects", dict())}
+
+
+def save_state(cache_directory, state):
+    write_json_file(os.path.join(cache_directory, STATE_FILENAME), "projects", state["projects"])
+
+
+def remove_stale_images(cache_directory, project_name, inputs_hash):
+    """Remove a project's recorded images if its build inputs have changed.
+
+    Called before the project's commands run, so they build new images
+    instead of using the stale ones. Images also recorded for other
+    projects are kept. Must be called while holding the Docker lock.
+    """
+    state = load_state(cache_directory)
+    previous = state["projects"].get(project_name)
+    if previous is None or previous["inputs_hash"] == inputs_hash:
+        return
+    logging.info("Docker build inputs changed, removing previous images.")
+    still_used_image_ids = set().union(*[
+        other_state["images"] for (other_name, other_state) in state["projects"].items()
+        if other_name != project_name
+    ])
+    remove_images(set(previous["images"]) - still_used_image_ids)
+    del state["projects"][project_name]
+    save_state(cache_directory, state)
+
+
+def record_project_images(cache_directory, project_name, inputs_hash, new_image_ids):
+    """Record the images used by a project.
+
+    The new images are added to the images already recorded for the
+    project, which remove_stale_images has removed if the build inputs
+    changed. Must be called while holding the Docker lock.
+    """
+    state = load_state(cache_directory)
+    previous = state["projects"].get(project_name)
+    image_ids = set(new_image_ids)
+    if previous and previous["inputs_hash"] == inputs_hash:
+        image_ids.update(previous["images"])
+    state["projects"][project_name] = {
+        "inputs_hash": inputs_hash,
+        "images": sorted(image_ids),
+        "last_used": time.time(),
+    }
+    save_state(cache_directory, state)
+
+
+def evict_images(cache_directory, budget_bytes, keep_project=None):
+    """Remove images of least recently used projects until within budget.
+
+    Stopped containers and dangling images are also removed. Must be
+    called while holding the Docker lock.
+
+    Args:
+        budget_bytes: (int) Maximum total size of recorded images.
+        keep_project: (str) Name of a project whose images are never evicted.
+    """
+    run_shell(
+        [
+            ["docker", "container", "prune", "--force"],
+            # Only untagged images, so images of other tools on the host are kept
+            ["docker", "image", "prune", "--force", "--filter", "dangling=true"],
+        ],
+        display=False,
+    )
+    state = load_state(cache_directory)
+    existing_image_ids = get_image_ids()
+    for project_state in state["projects"].values():
+        project_state["images"] = [image_id for image_id in project_state["images"] if image_id in existing_image_ids]
+    sizes = get_image_sizes(set().union(*[project["images"] for project in state["projects"].values()]))
+    total_bytes = sum(sizes.values())
+    logging.info("Cached Docker images use {:.1f} of {:.1f} GB.".format(total_bytes / 1e9, budget_bytes / 1e9))
+    projects_by_age = sorted(state["projects"].items(), key=lambda item: item[1]["last_used"])
+    for (project_name, project_state) in projects_by_age:
+        if total_bytes <= budget_bytes:
+            break
+        if project_name == keep_project:
+            continue
+        logging.info("Evicting Docker images of {}.".format(project_name))
+        still_used_image_ids = set().union(*[
+            other_state["images"] for (other_name, other_state) in state["projects"].items()
+            if other_name != project_name
+        ])
+        evicted_image_ids = set(project_state["images"]) - still_used_image_ids
+        remove_images(evicted_image_ids)
+        total_bytes -= sum(sizes.get(image_id, 0) for image_id in evicted_image_ids)
+        del state["projects"][project_name]
+    save_state(cache_directory, state)
@@ -0,0 +1,193 @@
+"""Access to git repositories through long-lived git processes."""
+
+import logging
+import threading
+import subprocess
+from metrics import span
+from utils import run_shell, remove_directory
+
+# Maximum number of paths passed to a single git command
+PATHS_PER_COMMAND = 500
+
+
+class GitCommandError(RuntimeError):
+    """Raised when a git command exits with an error."""
+
+    def __init__(self, command, returncode, stderr):
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+        message = "Command '{}' returned with error (code {}): {}"
+        super().__init__(message.format(" ".join(command), returncode, stderr.strip()))
+
+
+class GitObjectReader:
+    """Reads git objects by ID through a persistent git cat-file process.
+
+    The process is started on first use and shared safely between threads.
+    Object IDs never change, so one reader can serve every worktree of a
+    repository without returning stale data.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.process = None
+        self.lock = threading.Lock()
+
+    def read(self, object_id):
+        """Return the contents of an object as bytes, or None if it doesn't exist."""
+        with self.lock:
+            if self.process is None:
+                self.process = subprocess.Popen(
+                    ["git", "cat-file", "--batch"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    cwd=self.directory,
+                )
+            self.process.stdin.write(object_id.encode("utf-8") + b"\n")
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().decode("utf-8").split()
+            if len(header) != 3:
+                # Object is missing or ambiguous
+                return None
+            contents = self.process.stdout.read(int(header[2]))
+            # Discard the trailing newline
+            self.process.stdout.read(1)
+        return contents
+
+    def close(self):
+        with self.lock:
+            if self.process is not None:
+                self.process.stdin.close()
+                self.process.wait()
+                self.process = None
+
+
+class GitRepository:
+    """A git repository or worktree.
+
+    Commands are run directly (never through a shell), and raise
+    GitCommandError with the command's error output if they fail. Objects
+    are read through a GitObjectReader, which is shared with worktrees
+    created by for_worktree.
+    """
+
+    def __init__(self, directory, object_reader=None, worktree_lock=None):
+        self.directory = directory
+        self.objects = object_reader or GitObjectReader(directory)
+        # Git reads the admin files of all worktrees when adding one, so
+        # worktrees must not be added, removed or pruned concurrently
+        self.worktree_lock = worktree_lock or threading.Lock()
+
+    def for_worktree(self, directory):
+        """Return a repository for a worktree, sharing this repository's object reader."""
+        return GitRepository(directory, object_reader=self.objects, worktree_lock=self.worktree_lock)
+
+    def add_worktree(self, directory, commit, options=None):
+        """Add a worktree, replacing any directory already at its path.
+
+        Args:
+            directory: (str) Path of the worktree.
+            commit: (str) Commit to check out in the worktree.
+            options: (list of str) Options for git worktree add, such as
+                a branch to create.
+
+        Returns:
+            GitRepository for the worktree.
+        """
+        with self.worktree_lock:
+            remove_directory(directory)
+            self.run(["worktree", "add", "--force"] + (options or []) + [directory, commit])
+        return self.for_worktree(directory)
+
+    def remove_worktree(self, directory):
+        """Remove a worktree and its directory."""
+        with self.worktree_lock:
+            self.run(["worktree", "remove", "--force", directory])
+
+    def prune_worktrees(self):
+        """Remove the records of worktrees whose directories no longer exist."""
+        with self.worktree_lock:
+            self.run(["worktree", "prune"])
+
+    def run(self, arguments, check=True, display=False):
+        """Run a git command in the repository.
+
+        Args:
+            arguments: (list of str) Arguments to git.
+            check: (bool) True to raise GitCommandError if the command fails.
+            display: (bool) True to log the output of the command.
+
+        Returns:
+            subprocess.CompletedProcess.
+        """
+        command = ["git"] + arguments
+        with span("shell", " ".join(command[:2])) as command_span:
+            result = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.directory,
+            )
+            command_span.bytes_received = len(result.stdout)
+            if check and result.returncode != 0:
+                raise GitCommandError(command, result.returncode, result.stderr.decode("utf-8", "replace"))
+        if display:
+            output = (result.stdout + result.stderr).decode("utf-8", "replace").strip()
+            if output:
+                logging.info(output)
+        return result
+
+    def checkout_branch(self, branch):
+        """Check out a branch, creating it if required, and pull it if it exists on origin."""
+        if self.run(["checkout", branch], check=False, display=True).returncode == 0:
+            logging.info("Checked out existing branch {}.".format(branch))
+        else:
+            logging.info("Checking out to new branch {}.".format(branch))
+            self.run(["checkout", "-b", branch])
+        if self.run(["pull"], check=False, display=True).returncode != 0:
+            logging.info("Cannot pull (branch {} probably doesn't exist on GitHub), skipping step.".format(branch))
+
+    def reset(self):
+        """Discard all changes, including untracked files created by root in Docker."""
+        self.run(["reset", "--hard", "--quiet"])
+        run_shell(["sudo", "git", "clean", "-fdx", "--quiet"], cwd=self.directory)
+
+    def run_with_paths(self, arguments, paths):
+        """Run a git command with paths appended, using as few commands as possible."""
+        for i in range(0, len(paths), PATHS_PER_COMMAND):
+            self.run(arguments + ["--"] + paths[i:i + PATHS_PER_COMMAND])
+
+    def stage(self, paths):
+        """Add the given paths to the index."""
+        self.run_with_paths(["add"], paths)
+
+    def unstage(self, paths):
+        """Reset the index entries of the given paths to HEAD."""
+        self.run_with_paths(["reset", "--quiet", "HEAD"], paths)
+
+    def has_staged_changes(self):
+        return self.run(["diff", "--cached", "--quiet"], check=False).returncode == 1
+
+    def get_tree_files(self, tree="HEAD"):
+        """Return a dictionary mapping each file path in a tree to its object ID."""
+        result = self.run(["ls-tree", "-r", "-z", "--full-tree", tree])
+        files = dict()
+        for entry in result.stdout.decode("utf-8").split("\0"):
+            if entry:
+                (details, path) = entry.split("\t", 1)
+                files[path] = details.split()[2]
+        return files
+
+    def get_index_files(self):
+        """Return a dictionary mapping each file path in the index to its object ID."""
+        result = self.run(["ls-files", "--stage", "-z"])
+        files = dict()
+        for entry in result.stdout.decode("utf-8").split("\0"):
+            if entry:
+                (details, path) = entry.split("\t", 1)
+                files[path] = details.split()[1]
+        return files
+
+    def close(self):
+        self.objects.close()
@@ -0,0 +1,310 @@
+"""Batched access to GitHub data needed by every run.
+
+The default branch commit, open pull requests, and open issues created
+by the bot are read for all repositories of the organisation with a few
+paginated GraphQL queries, rather than several REST requests per
+repository. The results are kept in memory for the run, and are updated
+as pull requests are created. Config files are read separately, in
+batches, for only the repositories that have changed.
+"""
+
+import logging
+import requests
+from metrics import span
+from utils.retries import (
+    send_with_retries,
+    is_retryable_status,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_BACKOFF_FACTOR,
+)
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+# Repositories per query page, each with up to CONNECTION_SIZE pull
+# requests and issues
+REPOSITORIES_PER_PAGE = 25
+CONNECTION_SIZE = 100
+FILES_PER_QUERY = 50
+DEFAULT_TIMEOUT = (10, 60)
+RATE_LIMIT_WARNING = 500
+
+REPOSITORY_FIELDS = """
+fragment RepositoryFields on Repository {
+  name
+  nameWithOwner
+  pushedAt
+  defaultBranchRef { target { oid } }
+  pullRequests(states: OPEN, first: %(size)d) {
+    pageInfo { hasNextPage }
+    nodes { number title headRefName baseRefName headRepositoryOwner { login } }
+  }
+  issues(states: OPEN, first: %(size)d, filterBy: {createdBy: $bot}) {
+    pageInfo { hasNextPage }
+    nodes { number title body }
+  }
+}
+"""
+
+ORGANISATION_QUERY = """
+query($owner: String!, $bot: String!, $cursor: String) {
+  rateLimit { cost remaining resetAt }
+  repositoryOwner(login: $owner) {
+    repositories(first: %(page)d, after: $cursor, orderBy: {field: NAME, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes { ...RepositoryFields }
+    }
+  }
+}
+"""
+
+REPOSITORY_QUERY = """
+query($owner: String!, $name: String!, $bot: String!) {
+  rateLimit { cost remaining resetAt }
+  repository(owner: $owner, name: $name) { ...RepositoryFields }
+}
+"""
+
+FILE_FIELDS = """
+  repository_%(number)d: repository(owner: "%(owner)s", name: "%(name)s") {
+    file: object(expression: "HEAD:%(path)s") {
+      ... on Blob { text }
+    }
+  }
+"""
+
+
+class GitHubClient:
+    """Client for the GitHub GraphQL API.
+
+    Requests that fail with a connection error, timeout, rate limit (403
+    or 429, including secondary rate limits) or server error (5xx) are
+    retried with exponential backoff, waiting at least as long as any
+    Retry-After header asks. The remaining rate limit reported by each
+    query is tracked.
+    """
+
+    def __init__(self, token, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.rate_limit_remaining = None
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = "bearer {}".format(token)
+
+    def query(self, query_name, query, **variables):
+        """Run a GraphQL query and return its data.
+
+        Args:
+            query_name: (str) Name of the query, used for metrics and logging.
+            query: (str) GraphQL query document.
+            variables: (dict) Query variables.
+
+        Returns:
+            Dictionary of data returned by the query.
+        """
+        with span("github", query_name) as request_span:
+            response = send_with_retries(
+                lambda: self.session.post(
+                    GRAPHQL_URL,
+                    json={"query": query, "variables": variables},
+                    timeout=self.timeout,
+                ),
+                "GitHub",
+                query_name,
+                request_span,
+                max_retries=self.max_retries,
+                backoff_factor=self.backoff_factor,
+                is_retryable=is_retryable,
+            )
+            request_span.bytes_sent = len(response.request.body)
+            request_span.bytes_received = len(response.content)
+            response.raise_for_status()
+            result = response.json()
+            if result.get("errors"):
+                raise RuntimeError("GitHub '{}' query failed: {}".format(query_name, result["errors"]))
+            data = result["data"]
+            self.update_rate_limit(data.get("rateLimit"))
+            return data
+
+    def update_rate_limit(self, rate_limit):
+        if not rate_limit:
+            return
+        self.rate_limit_remaining = rate_limit["remaining"]
+        if self.rate_limit_remaining < RATE_LIMIT_WARNING:
+            logging.warning("GitHub rate limit low: {} points remaining until {}.".format(
+                self.rate_limit_remaining,
+                rate_limit["resetAt"],
+            ))
+
+    def close(self):
+        self.session.close()
+
+
+def is_retryable(response):
+    """Return True if the response is a rate limit or server error.
+
+    GitHub also uses 403 for permission errors, so a 403 is only retried
+    if it asks to wait or reports no remaining rate limit.
+    """
+    if response.status_code == 403:
+        return "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0"
+    return is_retryable_status(response)
+
+
+def load_repository_index(client, owner, bot_login, repository_name=None):
+    """Read the data needed for each repository of the owner.
+
+    Args:
+        client: (GitHubClient) Client to send queries with.
+        owner: (str) Login of the organisation or user owning the repositories.
+        bot_login: (str) Login of the bot account.
+        repository_name: (str) Name of a single repository to read, or
+            None to read all repositories.
+
+    Returns:
+        Dictionary mapping repository names to dictionaries of data, as
+        returned by parse_repository.
+    """
+    fields = REPOSITORY_FIELDS % {"size": CONNECTION_SIZE}
+    index = dict()
+    if repository_name:
+        data = client.query(
+            "get_repository_index",
+            REPOSITORY_QUERY + fields,
+            owner=owner,
+            name=repository_name,
+            bot=bot_login,
+        )
+        nodes = [data["repository"]]
+        if not data["repository"]:
+            logging.warning("Repository {}/{} not found.".format(owner, repository_name))
+    else:
+        nodes = []
+        cursor = None
+        while True:
+            data = client.query(
+                "get_repository_index",
+                ORGANISATION_QUERY % {"page": REPOSITORIES_PER_PAGE} + fields,
+                owner=owner,
+                bot=bot_login,
+                cursor=cursor,
+            )
+            repositories = data["repositoryOwner"]["repositories"]
+            nodes.extend(repositories["nodes"])
+            if not repositories["pageInfo"]["hasNextPage"]:
+                break
+            cursor = repositories["pageInfo"]["endCursor"]
+    for node in nodes:
+        if node:
+            index[node["name"]] = parse_repository(node, owner)
+    logging.info("Read GitHub data for {} repositories ({} rate limit points remaining).".format(
+        len(index),
+        client.rate_limit_remaining,
+    ))
+    return index
+
+
+def parse_repository(node, owner):
+    """Convert a repository node from a query into a dictionary of data.
+
+    Pull requests and issues are only marked complete if all of them were
+    returned, otherwise they are read again through the REST API.
+
+    Returns:
+        Dictionary with the full name, time of the last push, default
+        branch commit SHA (or None if empty), the list of open pull
+        requests from branches of the repository, the list of open issues
+        created by the bot, and whether each list is complete.
+    """
+    pulls = []
+    for pull in node["pullRequests"]["nodes"]:
+        head_owner = pull["headRepositoryOwner"]
+        if head_owner and head_owner["login"] == owner:
+            pulls.append({
+                "number": pull["number"],
+                "title": pull["title"],
+                "head": pull["headRefName"],
+                "base": pull["baseRefName"],
+            })
+    default_branch = node["defaultBranchRef"]
+    return {
+        "full_name": node["nameWithOwner"],
+        "pushed_at": node["pushedAt"],
+        "head": default_branch["target"]["oid"] if default_branch else None,
+        "pulls": pulls,
+        "pulls_complete": not node["pullRequests"]["pageInfo"]["hasNextPage"],
+        "issues": node["issues"]["nodes"],
+        "issues_complete": not node["issues"]["pageInfo"]["hasNextPage"],
+    }
+
+
+def load_file_texts(client, owner, path, repository_names):
+    """Read a file from the default branch of each of the given repositories.
+
+    Files are read in batches of FILES_PER_QUERY repositories per query.
+
+    Args:
+        client: (GitHubClient) Client to send queries with.
+        owner: (str) Login of the owner of the repositories.
+        path: (str) Path of the file in each repository.
+        repository_names: (list of str) Names of repositories to read from.
+
+    Returns:
+        Dictionary mapping repository names to the file text, or None if
+        the file doesn't exist.
+    """
+    texts = dict()
+    for start in range(0, len(repository_names), FILES_PER_QUERY):
+        batch = repository_names[start:start + FILES_PER_QUERY]
+        query = "query {\n  rateLimit { cost remaining resetAt }\n"
+        for (number, name) in enumerate(batch):
+            query += FILE_FIELDS % {"number": number, "owner": owner, "name": name, "path": path}
+        query += "}\n"
+        data = client.query("get_file_texts", query)
+        for (number, name) in enumerate(batch):
+            repository = data["repository_{}".format(number)] or dict()
+            texts[name] = (repository.get("file") or dict()).get("text")
+    return texts
+
+
+def has_open_pull(project, head, base):
+    """Return True if an open pull request exists from the head to the base branch.
+
+    Args:
+        project: (Project) Project with repository data read at the start of the run.
+        head: (str) Name of the branch to merge.
+        base: (str) Name of the branch to merge into.
+    """
+    data = project.github_data
+    if data and data["pulls_complete"]:
+        return any(pull["head"] == head and pull["base"] == base for pull in data["pulls"])
+    with span("github", "get_pulls"):
+        owner = project.repo.owner.login
+        return len(list(project.repo.get_pulls(state="open", head=owner + ":" + head, base=base))) > 0
+
+
+def record_pull(project, pull, head, base):
+    """Add a newly created pull request to the project's repository data."""
+    if project.github_data:
+        project.github_data["pulls"].append({
+            "number": pull.number,
+            "title": pull.title,
+            "head": head,
+            "base": base,
+        })
+
+
+def get_bot_issues(project):
+    """Return the open issues created by the bot.
+
+    Returns:
+        List of dictionaries with the number, title, and body of each issue.
+    """
+    data = project.github_data
+    if data and data["issues_complete"]:
+        return data["issues"]
+    with span("github", "get_issues"):
+        return [
+            {"number": issue.number, "title": issue.title, "body": issue.body}
+            for issue in project.repo.get_issues(creator=project.bot)
+        ]
@@ -0,0 +1,121 @@
+"""Retrying HTTP requests that fail with a connection error, rate limit or server error.
+
+Failed requests are retried with exponential backoff, waiting at least
+as long as any Retry-After header asks. Requests that aren't safe to send
+twice can be limited to retrying failures where the request never
+reached the server.
+"""
+
+import time
+import logging
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 2
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def is_retryable_status(response):
+    """Return True if the response is a rate limit (429) or server error."""
+    return response.status_code in RETRY_STATUS_CODES
+
+
+def is_rate_limited(response):
+    """Return True if the response is a rate limit (429), which the server didn't act on."""
+    return response.status_code == 429
+
+
+def is_connection_error(error):
+    """Return True for any connection error or timeout."""
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def is_connect_error(error):
+    """Return True if the request failed before a connection to the server was made.
+
+    Errors after connecting, such as read timeouts or dropped connections,
+    return False, as the server may have received the request.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    # A failure to connect (including name resolution) is wrapped by urllib3
+    # as the reason of a MaxRetryError
+    return isinstance(getattr(error.args[0], "reason", None), ConnectTimeoutError)
+
+
+def get_backoff_delay(backoff_factor, attempt):
+    """Return the seconds to wait before a retry, doubled for each attempt."""
+    return backoff_factor * (2 ** attempt)
+
+
+def get_retry_after(response, default=0, maximum=None):
+    """Return the seconds requested by a response's Retry-After header.
+
+    Args:
+        response: (requests.Response) Response to read the header of.
+        default: (float) Seconds returned if the header is missing or
+            isn't a number of seconds.
+        maximum: (float) Maximum seconds returned, or None for no limit.
+    """
+    try:
+        seconds = max(float(response.headers.get("Retry-After", default)), 0)
+    except ValueError:
+        seconds = default
+    if maximum is not None:
+        seconds = min(seconds, maximum)
+    return seconds
+
+
+def send_with_retries(send, service, name, request_span, max_retries=DEFAULT_MAX_RETRIES,
+                      backoff_factor=DEFAULT_BACKOFF_FACTOR, is_retryable=is_retryable_status,
+                      is_retryable_error=is_connection_error):
+    """Send a request, retrying it if it fails.
+
+    Args:
+        send: (function) Sends the request, and returns its response.
+        service: (str) Name of the service, used for logging, for example "Crowdin".
+        name: (str) Name of the request, used for logging.
+        request_span: (Span) Span of the request, whose retries are set.
+        max_retries: (int) Maximum number of retries.
+        backoff_factor: (float) Seconds to wait before the first retry.
+        is_retryable: (function) Given a response, returns True if the
+            request should be retried.
+        is_retryable_error: (function) Given a connection error or
+            timeout, returns True if the request should be retried.
+
+    Returns:
+        Response of the final attempt.
+
+    Raises:
+        requests.ConnectionError or requests.Timeout if the final attempt
+        failed to connect or timed out, or the error isn't retryable.
+    """
+    attempt = 0
+    while True:
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if not is_retryable_error(e) or attempt >= max_retries:
+                raise
+            delay = get_backoff_delay(backoff_factor, attempt)
+            reason = type(e).__name__
+        else:
+            if not is_retryable(response) or attempt >= max_retries:
+                return response
+            delay = max(get_backoff_delay(backoff_factor, attempt), get_retry_after(response))
+            reason = "status {}".format(response.status_code)
+            response.close()
+        attempt += 1
+        request_span.retries = attempt
+        logging.warning("{} '{}' request failed ({}), retry {} of {} in {:.1f}s.".format(
+            service,
+            name,
+            reason,
+            attempt,
+            max_retries,
+            delay,
+        ))
+        time.sleep(delay)
@@ -0,0 +1,79 @@
+"""Journal of the units of work completed by a run, used to resume failed runs.
+
+A unit is a task run on a repository, or part of a task such as pulling
+a single language. Each completed unit is stored with a hash of its
+inputs, and is only skipped by a resumed run if its inputs are unchanged.
+The journal is written after every completed unit, so it survives the
+run failing or being stopped.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from utils import file_lock, read_json_file, write_json_file
+
+JOURNAL_FILENAME = "run-journal.json"
+
+
+def get_input_hash(*inputs):
+    """Return a hash of the given JSON serialisable inputs."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_unit_name(*parts):
+    """Return the name of a unit, such as ("cs-unplugged", "pull-translations", "de")."""
+    return "/".join(parts)
+
+
+class RunJournal:
+    """Units completed by the current run, and by the run it resumes.
+
+    Journals are passed to worker processes, and units recorded by all
+    processes are added to the same file.
+    """
+
+    def __init__(self, cache_directory, resume=False, filename=JOURNAL_FILENAME):
+        """Open the journal.
+
+        Args:
+            cache_directory: (str) Directory to store the journal in.
+            resume: (bool) True to skip units completed by the previous
+                run. Otherwise, clear should be called before recording
+                units, to start a new journal.
+            filename: (str) Name of the journal file, so journals of
+                different kinds of run don't replace each other.
+        """
+        self.path = os.path.join(cache_directory, filename)
+        self.lock_path = os.path.splitext(self.path)[0] + ".lock"
+        self.resume = resume
+        if resume:
+            self.completed_units = self.read()
+            logging.info("Resuming run, {} units already completed.".format(len(self.completed_units)))
+        else:
+            self.completed_units = dict()
+
+    def clear(self):
+        """Remove the units recorded by previous runs."""
+        with file_lock(self.lock_path):
+            self.write(dict())
+        self.completed_units = dict()
+
+    def read(self):
+        return read_json_file(self.path, "units", dict())
+
+    def write(self, units):
+        """Write the units to the journal file."""
+        write_json_file(self.path, "units", units)
+
+    def is_complete(self, unit, input_hash):
+        """Return True if resuming and the unit was completed with the same inputs."""
+        return self.resume and self.completed_units.get(unit) == input_hash
+
+    def record(self, unit, input_hash):
+        """Record a unit as completed with the given inputs."""
+        with file_lock(self.lock_path):
+            units = self.read()
+            units[unit] = input_hash
+            self.write(units)
+        self.completed_units[unit] = input_hash
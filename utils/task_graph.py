@@ -0,0 +1,63 @@
+"""Running tasks concurrently, in the order set by their dependencies."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def run_task_graph(tasks, dependencies, run_task):
+    """Run each task once all of the tasks it depends on have succeeded.
+
+    Tasks that don't depend on each other run at the same time, each on
+    its own thread. If a task fails, the tasks depending on it are skipped,
+    but other tasks still run.
+
+    Args:
+        tasks: (list of str) Names of the tasks to run, in order of priority.
+        dependencies: (dict) Mapping of task names to lists of the tasks
+            they depend on. Dependencies that are not being run are ignored.
+        run_task: (function) Given a task name, runs the task.
+
+    Returns:
+        Dictionary mapping each task to "succeeded", "failed" or "skipped".
+
+    Raises:
+        ValueError if the tasks have circular dependencies.
+    """
+    task_dependencies = {
+        task: [dependency for dependency in dependencies.get(task, []) if dependency in tasks]
+        for task in tasks
+    }
+    outcomes = dict()
+    running = dict()
+    with ThreadPoolExecutor(max_workers=max(len(tasks), 1)) as executor:
+        while len(outcomes) < len(tasks):
+            finished_count = len(outcomes)
+            for task in tasks:
+                if task in outcomes or task in running.values():
+                    continue
+                dependency_outcomes = [outcomes.get(dependency) for dependency in task_dependencies[task]]
+                if FAILED in dependency_outcomes or SKIPPED in dependency_outcomes:
+                    logging.warning("Skipping '{}' task, as a task it depends on did not succeed.".format(task))
+                    outcomes[task] = SKIPPED
+                elif all(outcome == SUCCEEDED for outcome in dependency_outcomes):
+                    running[executor.submit(run_task, task)] = task
+            if not running:
+                if len(outcomes) == finished_count:
+                    blocked_tasks = [task for task in tasks if task not in outcomes]
+                    raise ValueError("Tasks have circular dependencies: {}".format(", ".join(blocked_tasks)))
+                continue
+            (finished, _) = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    logging.exception("Error while running '{}' task.".format(task))
+                    outcomes[task] = FAILED
+                else:
+                    outcomes[task] = SUCCEEDED
+    return outcomes